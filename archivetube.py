@@ -6,10 +6,21 @@ import sys
 import sqlite3
 import argparse
 import time
+import collections
+import concurrent.futures
+import multiprocessing
+import PIL
 from server import Server
 import atcommon as atc
 import atstatistics as ats
 
+
+__archiveInfoSQL__ = "SELECT dbversion,name,url,language,description,location,joined,links,videos,lastupdate FROM channel ORDER BY id DESC LIMIT 1;"
+__channelUpsertSQL__ = "INSERT INTO channels(relpath,abspath,name,url,language,description,location,joined,links,videos,lastupdate,active) VALUES(?,?,?,?,?,?,?,?,?,?,?,1) ON CONFLICT(relpath) DO UPDATE SET abspath=excluded.abspath,name=excluded.name,url=excluded.url,language=excluded.language,description=excluded.description,location=excluded.location,joined=excluded.joined,links=excluded.links,videos=excluded.videos,lastupdate=excluded.lastupdate,active=1 RETURNING id;"
+__channelImagesUpsertSQL__ = "INSERT INTO channelImages(id,profile,profileformat,banner,bannerformat) SELECT ?,profile,profileformat,banner,bannerformat FROM archivedb.channel WHERE true ORDER BY id DESC LIMIT 1 ON CONFLICT(id) DO UPDATE SET profile=excluded.profile,profileformat=excluded.profileformat,banner=excluded.banner,bannerformat=excluded.bannerformat;"
+__videoUpsertSQL__ = "INSERT INTO videos(id,channelID,title,timestamp,description,subtitles,filepath,duration,tags,language,width,height,resolution,viewcount,likecount,dislikecount,statisticsupdated,chapters,active) SELECT youtubeID,?,title,timestamp,description,subtitles,? || filename,duration,tags,language,width,height,resolution,viewcount,likecount,dislikecount,statisticsupdated,chapters,1 FROM archivedb.videos WHERE true ON CONFLICT(id) DO UPDATE SET channelID=excluded.channelID,title=excluded.title,timestamp=excluded.timestamp,description=excluded.description,subtitles=excluded.subtitles,filepath=excluded.filepath,duration=excluded.duration,tags=excluded.tags,language=excluded.language,width=excluded.width,height=excluded.height,resolution=excluded.resolution,viewcount=excluded.viewcount,likecount=excluded.likecount,dislikecount=excluded.dislikecount,statisticsupdated=excluded.statisticsupdated,chapters=excluded.chapters,active=1;"
+__thumbUpsertSQL__ = "INSERT INTO thumbs(id,thumb,thumbformat) SELECT youtubeID,thumb,thumbformat FROM archivedb.videos WHERE true ON CONFLICT(id) DO UPDATE SET thumb=excluded.thumb,thumbformat=excluded.thumbformat,thumbsmall=NULL;"
+
 # --------------------------------------------------------------------------- #
 def main(args):
     '''The main archive tube function
@@ -25,6 +36,7 @@ def main(args):
     parser.add_argument("-i", "--index", action="store_const", dest="index", const=True, default=False, help="(Re-)create the index (this might take a while)")
     parser.add_argument("-s", "--statistics", action="store_const", dest="statistics", const=True, default=False, help="(Re-)calculate the statistics (this might take a while)")
     parser.add_argument("-l", "--listen", action="store", dest="listen", default="0.0.0.0:8080", help="The IP:Port combination(s) to listen on (can be multiple, seperated by a space). IPv6 addresses must be in square brackets. Default: 0.0.0.0:8080")
+    parser.add_argument("-t", "--threads", action="store", dest="threads", type=int, default=os.cpu_count(), help="The number of threads serving requests (Default: number of CPUs)")
     parser.add_argument("-V", "--version", action="version", version='%(prog)s {}'.format(atc.__version__))
     parser.add_argument("DIR", help="The directory to work in")
 
@@ -45,6 +57,7 @@ def main(args):
 
     if args.memory:
         print("Using in-memory database")
+    upgraded = False
 
     try:
         #Check if database exists
@@ -52,25 +65,22 @@ def main(args):
         try:
             if os.path.isfile(dbPath):
                 #Connect to database
-                t1 = time.perf_counter()
+                if args.verbose:
+                    t1 = time.perf_counter_ns()
                 if args.memory:
                     print("Reading existing database")
-                    fileDBCon = atc.connectDB(dbPath)
-                    dbCon = sqlite3.connect(":memory:", check_same_thread=False)
-                    fileDBCon.backup(dbCon)
-                    fileDBCon.close()
+                    dbCon, upgraded = atc.loadDB(dbPath, checkThread=False)
                 else:
                     print("Connect to existing database")
                     dbCon = atc.connectDB(dbPath, checkThread=False)
-                t2 = time.perf_counter()
-                t = t2 - t1
                 if args.verbose:
-                    print("Read time: {:0.4f} seconds".format(t))
+                    t2 = time.perf_counter_ns()
+                    print("Read time: {:0.4f} seconds".format((t2 - t1) / 1e9))
             else:
                 #No database found
                 print("No database found, creating one")
                 if args.memory:
-                    dbCon = atc.createDB(":memory:", checkThread=False)
+                    dbCon = atc.createDB(atc.__memorydburi__, checkThread=False)
                 else:
                     dbCon = atc.createDB(dbPath, checkThread=False)
         except sqlite3.Error as e:
@@ -85,57 +95,59 @@ def main(args):
                 print("Adding archive '{}' to the database".format(rel))
             cmd = "INSERT INTO archives(relpath, abspath, recursive) VALUES(?,?,?)"
             dbCon.execute(cmd, (rel, args.folder, args.recursive))
+            dbCon.commit()
             if args.verbose:
                 print("Forcing index and statistics")
 
-        #(Re-)indexing
-        if taskIndex:
-            print("(Re-)building index")
-            t1 = time.perf_counter()
-            reIndex(dbCon, path)
-            dbCon.commit()
-            t2 = time.perf_counter()
-            t = t2 - t1
-            if args.verbose:
-                print("Index time: {:0.4f} seconds".format(t))
+        #Run tasks
+        if args.memory or not (taskIndex or taskStats):
+            runTasks(dbCon, path, taskIndex, taskStats, args.verbose)
         else:
-            if args.verbose:
-                print("Skip indexing")
-
-        #(Re-)calculating statistics
-        if taskStats:
-            print("(Re-)calculating statistics")
-            t1 = time.perf_counter()
-            dbCon.row_factory = sqlite3.Row
-            db = dbCon.cursor()
-            try:
-                ats.run(db, verbose=args.verbose)
-            except ats.StatisticsError as e:
-                sys.exit("ERROR in statistics: {}".format(e))
-            dbCon.commit()
-            t2 = time.perf_counter()
-            t = t2 - t1
-            if args.verbose:
-                print("Statistics time: {:0.4f} seconds".format(t))
-        else:
-            if args.verbose:
-                print("Skip calculting statistics")
+            #Use a separate process, so the memory used by indexing and statistics is freed before the server starts
+            proc = multiprocessing.Process(target=runTasksProcess, args=(dbPath, path, taskIndex, taskStats, args.verbose))
+            proc.start()
+            proc.join()
+            if proc.exitcode:
+                sys.exit(proc.exitcode)
 
         #Write changes to database
-        if args.memory and (taskIndex or taskStats):
+        if args.memory and (taskIndex or taskStats or upgraded):
             print("Writing new database")
-            t1 = time.perf_counter()
-            try:
-                os.remove(dbPath)
-            except OSError:
-                pass
-            fileDBCon = sqlite3.connect(dbPath)
-            dbCon.backup(fileDBCon)
+            if args.verbose:
+                t1 = time.perf_counter_ns()
+            #Fold the write-ahead log into the old database first and remove it together with the shared memory
+            #file (stale -wal and -shm files would otherwise be applied to the new database when it is opened)
+            if os.path.isfile(dbPath):
+                try:
+                    oldDBCon = sqlite3.connect(dbPath)
+                    try:
+                        oldDBCon.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+                    finally:
+                        oldDBCon.close()
+                except sqlite3.Error:
+                    pass
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(dbPath + suffix)
+                except OSError:
+                    pass
+            if hasattr(dbCon, "serialize"):
+                #Write the whole database image at once (Python >= 3.11)
+                with open(dbPath, "wb") as f:
+                    f.write(dbCon.serialize())
+                fileDBCon = sqlite3.connect(dbPath)
+            else:
+                fileDBCon = sqlite3.connect(dbPath)
+                #The file is written from scratch, so skip journaling and syncing during the copy
+                fileDBCon.execute("PRAGMA journal_mode=OFF;")
+                fileDBCon.execute("PRAGMA synchronous=OFF;")
+                dbCon.backup(fileDBCon, pages=-1)
+            #Switch to WAL for the following runs (the copied header still has the rollback journal of the memory database)
+            fileDBCon.execute("PRAGMA journal_mode=WAL;")
             fileDBCon.close()
-            t2 = time.perf_counter()
-            t = t2 - t1
             if args.verbose:
-                print("Write time: {:0.4f} seconds".format(t))
+                t2 = time.perf_counter_ns()
+                print("Write time: {:0.4f} seconds".format((t2 - t1) / 1e9))
         else:
             if args.verbose:
                 print("Skip writing database")
@@ -145,14 +157,112 @@ def main(args):
 
     #Start server
     try:
+        #Every server thread opens its own read-only connection
+        readURI = atc.__memorydburi__ if args.memory else atc.readOnlyURI(dbPath)
+        pool = atc.ConnectionPool(readURI)
         baseinfo = {"name": atc.__prog__, "version": atc.__version__}
-        server = Server(dbCon, baseinfo, args.listen)
+        if args.verbose:
+            #Pillow-SIMD versions end with ".postN"
+            print("Using Pillow {}".format(PIL.__version__))
+        server = Server(pool, baseinfo, args.listen, args.threads)
         server.daemon = True
         server.start()
         server.join()
     except KeyboardInterrupt:
         #Stop server and exit
         print("Exiting...")
+
+    #Let SQLite refresh the query planner statistics if needed (changes to the in-memory database are not kept)
+    if not args.memory:
+        try:
+            dbCon.execute("PRAGMA optimize;")
+        except sqlite3.Error:
+            pass
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def runTasks(dbCon, dirpath, taskIndex, taskStats, verbose):
+    '''Run the index and statistics tasks
+
+    :param dbCon: Connection to the tube database
+    :type dbCon: sqlite3.Connection
+    :param dirpath: The path of the working directory
+    :type dirpath: string
+    :param taskIndex: Whether to (re-)build the index
+    :type taskIndex: boolean
+    :param taskStats: Whether to (re-)calculate the statistics
+    :type taskStats: boolean
+    :param verbose: Whether to print more status info
+    :type verbose: boolean
+
+    :raises: :class:``sqlite3.Error: Database error
+    '''
+    #(Re-)indexing
+    if taskIndex:
+        print("(Re-)building index")
+        if verbose:
+            t1 = time.perf_counter_ns()
+        #Skip syncing during rebuild, the index can always be recreated from the archives
+        dbCon.execute("PRAGMA synchronous=OFF;")
+        try:
+            reIndex(dbCon, dirpath)
+            dbCon.commit()
+        finally:
+            #The safety level can't be changed inside a transaction, so discard what a failed rebuild left uncommitted
+            if dbCon.in_transaction:
+                dbCon.rollback()
+            dbCon.execute("PRAGMA synchronous=NORMAL;")
+        if verbose:
+            t2 = time.perf_counter_ns()
+            print("Index time: {:0.4f} seconds".format((t2 - t1) / 1e9))
+    else:
+        if verbose:
+            print("Skip indexing")
+
+    #(Re-)calculating statistics
+    if taskStats:
+        print("(Re-)calculating statistics")
+        if verbose:
+            t1 = time.perf_counter_ns()
+        dbCon.row_factory = sqlite3.Row
+        db = dbCon.cursor()
+        try:
+            ats.run(db, verbose=verbose)
+        except ats.StatisticsError as e:
+            sys.exit("ERROR in statistics: {}".format(e))
+        dbCon.commit()
+        if verbose:
+            t2 = time.perf_counter_ns()
+            print("Statistics time: {:0.4f} seconds".format((t2 - t1) / 1e9))
+    else:
+        if verbose:
+            print("Skip calculting statistics")
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def runTasksProcess(dbPath, dirpath, taskIndex, taskStats, verbose):
+    '''Run the index and statistics tasks with an own database connection
+    (target of the task process)
+
+    :param dbPath: Path of the tube database
+    :type dbPath: string
+    :param dirpath: The path of the working directory
+    :type dirpath: string
+    :param taskIndex: Whether to (re-)build the index
+    :type taskIndex: boolean
+    :param taskStats: Whether to (re-)calculate the statistics
+    :type taskStats: boolean
+    :param verbose: Whether to print more status info
+    :type verbose: boolean
+    '''
+    try:
+        dbCon = atc.connectDB(dbPath)
+        runTasks(dbCon, dirpath, taskIndex, taskStats, verbose)
+        dbCon.close()
+    except sqlite3.Error as e:
+        sys.exit("ERROR: Database error \"{}\"".format(e))
+    except KeyboardInterrupt:
+        pass
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
@@ -166,88 +276,201 @@ def reIndex(db, dirpath):
 
     :raises: :class:``sqlite3.Error: Database error
     '''
+    #Normalize working directory once, the archive paths are then built by joining only
+    dirpath = os.path.normpath(os.path.abspath(dirpath))
+
     #Get all archives from database
     archives = []
-    r = db.execute("SELECT relpath, recursive FROM archives;")
-    a = r.fetchall()
-    del r
-    for item in a:
-        abspath = os.path.normpath(os.path.abspath(os.path.join(dirpath, item[0])))
+    for item in db.execute("SELECT relpath, recursive FROM archives;"):
+        abspath = os.path.normpath(os.path.join(dirpath, item[0]))
         #Extract archives
         if item[1]:
-            subdirs = [os.path.join(abspath, name) for name in os.listdir(abspath) if os.path.isdir(os.path.join(abspath, name))]
-            archives += [os.path.relpath(sub, dirpath) for sub in subdirs if os.path.isfile(os.path.join(sub, "archive.db"))]
+            archives.extend(findArchives(abspath, dirpath))
         else:
             if os.path.isfile(os.path.join(abspath, "archive.db")):
                 archives.append(item[0])
     if not archives:
         sys.exit("ERROR: No archives in database")
 
-    #Set all channels to inactive and delete all videos
-    db.execute("UPDATE channels SET active = 0;")
+    #Delete all videos and thumbnails
     db.execute("DELETE FROM videos;")
+    db.execute("DELETE FROM thumbs;")
+    #Drop the secondary video indexes, building them once after copying all videos is faster than updating them on every insert
+    db.execute("DROP INDEX IF EXISTS idxVideosChannel;")
+    db.execute("DROP INDEX IF EXISTS idxVideosStats;")
+    db.execute("DROP INDEX IF EXISTS idxVideosActive;")
+    db.commit()
+    try:
+        seenChannels = set()
 
-    #Copy info
-    for relpath in archives:
-        abspath = os.path.normpath(os.path.abspath(os.path.join(dirpath, relpath)))
-        #Try opening archive database
-        try:
+        #Copy info (the archive databases are read ahead in worker threads, writing happens in this thread)
+        paths = [os.path.normpath(os.path.join(dirpath, relpath)) for relpath in archives]
+        for relpath, abspath, future in zip(archives, paths, readArchiveInfos(paths)):
+            name = os.path.basename(relpath)
             archivedbPath = os.path.join(abspath, "archive.db")
-            archivedb = sqlite3.connect(archivedbPath)
-        except sqlite3.Error as e:
-            print("ERROR: Unable to open '{}' archive database (Error: {})".format(os.path.basename(relpath), e))
-            continue
+            #Get archive db version and channel info
+            try:
+                row = future.result()
+            except sqlite3.Error as e:
+                print("ERROR: Unable to open '{}' archive database (Error: {})".format(name, e))
+                continue
 
-        #Check archive db version
-        try:
-            version = archivedb.execute("SELECT dbversion FROM channel ORDER BY id DESC LIMIT 1;").fetchone()[0]
-        except (sqlite3.Error, TypeError):
-            version = 1
-        if version < atc.__archivedbversion__:
-            print("ERROR: Archive database '{}' uses old database format. Please upgrade database using the latest version of ytarchiver".format(os.path.basename(relpath)))
-            continue
-
-        #Read channel info from archive database
-        try:
-            r = archivedb.execute("SELECT name,url,language,description,location,joined,links,profile,profileformat,banner,bannerformat,videos,lastupdate FROM channel ORDER BY id DESC LIMIT 1;")
-            info = (relpath, abspath) + r.fetchone()
-            del r
-        except sqlite3.Error as e:
-            print("ERROR: Unable to read channel info from '{}' archive database (Error: {})".format(os.path.basename(relpath), e))
-            continue
+            #Check archive db version
+            version = row[0] if row and row[0] else 1
+            if version < atc.__archivedbversion__:
+                print("ERROR: Archive database '{}' uses old database format. Please upgrade database using the latest version of ytarchiver".format(name))
+                continue
+            info = (relpath, abspath) + row[1:]
 
-        #Add or update channel info and get channel id
-        try:
-            insert = "INSERT INTO channels(relpath,abspath,name,url,language,description,location,joined,links,profile,profileformat,banner,bannerformat,videos,lastupdate,active) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,1);"
-            db.execute(insert, info)
-        except sqlite3.Error:
+            #Attach archive database read-only (has to happen outside of the transaction, as detaching is not possible within one)
+            db.execute("ATTACH DATABASE ? AS archivedb", (atc.readOnlyURI(archivedbPath),))
+
+            #Write channel and video info in a single transaction
+            db.execute("BEGIN IMMEDIATE")
             try:
-                info = info[1:] + (relpath,)
-                update = "UPDATE channels SET abspath=?,name=?,url=?,language=?,description=?,location=?,joined=?,links=?,profile=?,profileformat=?,banner=?,bannerformat=?,videos=?,lastupdate=?,active=1 WHERE relpath = ?;"
-                db.execute(update, info)
+                #Add or update channel info and get channel id
+                channelID = db.execute(__channelUpsertSQL__, info).fetchone()[0]
+                #Copy profile picture and banner
+                db.execute(__channelImagesUpsertSQL__, (channelID,))
+
+                #Copy video info
+                db.execute(__videoUpsertSQL__, (channelID, abspath + os.sep))
+                #Copy thumbnails
+                db.execute(__thumbUpsertSQL__)
+                db.commit()
+                seenChannels.add(channelID)
             except sqlite3.Error as e:
-                print("ERROR: Unable to write channel info from '{}' (Error: {})".format(os.path.basename(relpath), e))
-                continue
-        cmd = "SELECT id FROM channels WHERE relpath = ?"
-        r = db.execute(cmd, (relpath,)).fetchone()
-        channelID = r[0]
-        del r
+                db.rollback()
+                print("ERROR: Unable to write info from '{}' (Error: {})".format(name, e))
+            db.execute("DETACH DATABASE archivedb")
 
-        #Close archive database
-        archivedb.close()
-        db.commit()
+        #Set channels that were not found to inactive
+        db.execute("CREATE TEMP TABLE seenChannels (id INTEGER PRIMARY KEY);")
+        db.executemany("INSERT INTO temp.seenChannels(id) VALUES(?);", ((i,) for i in seenChannels))
+        db.execute("UPDATE channels SET active = 0 WHERE active = 1 AND id NOT IN (SELECT id FROM temp.seenChannels);")
+        db.execute("DROP TABLE temp.seenChannels;")
 
-        #Read video info
-        db.execute("ATTACH DATABASE ? AS archivedb", (archivedbPath,))
-        insert = "INSERT INTO videos(id,channelID,title,timestamp,description,subtitles,filepath,thumb,thumbformat,duration,tags,language,width,height,resolution,viewcount,likecount,dislikecount,statisticsupdated,chapters,active) SELECT youtubeID,{},title,timestamp,description,subtitles,\"{}{}\" || filename,thumb,thumbformat,duration,tags,language,width,height,resolution,viewcount,likecount,dislikecount,statisticsupdated,chapters,\"1\" FROM archivedb.videos;".format(channelID, abspath, os.sep)
-        db.execute(insert)
+        #Render the thumbnails in the size used by the video lists
+        renderSmallThumbs(db)
+    finally:
+        #Recreate indexes (also if indexing fails, so the database isn't left without them)
+        atc.createIndexes(db)
         db.commit()
-        db.execute("DETACH DATABASE archivedb")
 
-    #Update info fields
-    videos = db.execute("SELECT count(*) FROM videos WHERE active = 1;").fetchone()[0]
-    channels = db.execute("SELECT count(*) FROM channels WHERE active = 1;").fetchone()[0]
+    #Update info fields (all videos were re-added as active and the active channels are exactly the ones seen)
+    videos = db.execute("SELECT count(*) FROM videos;").fetchone()[0]
+    channels = len(seenChannels)
     db.execute("UPDATE info SET lastupdate = ?, videos = ?, channels = ? WHERE id = 1", (int(time.time()), videos, channels))
+
+    #Update query planner statistics (sampling at most 1000 rows per index)
+    db.execute("PRAGMA analysis_limit=1000;")
+    db.execute("ANALYZE;")
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def renderSmallThumbs(db):
+    '''Pre-render the small thumbnails of all videos, so the server doesn't have
+    to resize them on every request
+
+    The thumbnails are rendered in a thread pool (Pillow releases the GIL
+    while decoding, resizing and encoding) in batches to limit memory use
+
+    :param db: Connection to the tube database
+    :type db: sqlite3.Connection
+
+    :raises: :class:``sqlite3.Error: Database error
+    '''
+    ids = [row[0] for row in db.execute("SELECT id FROM thumbs WHERE thumb IS NOT NULL;")]
+    batch = 256
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for i in range(0, len(ids), batch):
+            part = ids[i:i+batch]
+            cmd = "SELECT id,thumb,thumbformat FROM thumbs WHERE id IN ({});".format(",".join("?" * len(part)))
+            rows = db.execute(cmd, part).fetchall()
+            db.executemany("UPDATE thumbs SET thumbsmall = ? WHERE id = ?;", executor.map(renderSmallThumb, rows))
+            db.commit()
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def renderSmallThumb(row):
+    '''Render the small version of a thumbnail
+
+    :param row: The id, thumbnail and mime type
+    :type row: tuple
+
+    :returns: The small thumbnail (None if the thumbnail couldn't be read) and the id
+    :rtype: tuple
+    '''
+    #Store NULL for any thumbnail that can't be rendered (broken data, decompression bombs, ...), the server then handles it on request
+    try:
+        return (Server.renderSmallThumb(row[1], row[2]), row[0])
+    except Exception:
+        return (None, row[0])
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def readArchiveInfos(paths):
+    '''Read the database version and channel info of archives in a thread pool
+
+    At most twice as many archives as there are worker threads are read ahead
+
+    :param paths: The absolute paths of the archives
+    :type paths: list
+
+    :returns: Futures with the results of readArchiveInfo in the order of the paths
+    :rtype: generator
+    '''
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for path in paths:
+            pending.append(executor.submit(readArchiveInfo, path))
+            if len(pending) > 2 * workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def readArchiveInfo(path):
+    '''Read the database version and channel info of an archive
+
+    :param path: The absolute path of the archive
+    :type path: string
+
+    :raises: :class:``sqlite3.Error: Unable to open archive database
+
+    :returns: The database version followed by the channel info (None if the info can't be read)
+    :rtype: tuple
+    '''
+    archivedb = sqlite3.connect(atc.readOnlyURI(os.path.join(path, "archive.db")), uri=True)
+    try:
+        r = archivedb.execute(__archiveInfoSQL__)
+        row = r.fetchone()
+        del r
+    except sqlite3.Error:
+        row = None
+    finally:
+        archivedb.close()
+    return row
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def findArchives(parentpath, dirpath):
+    '''Find the archives in the subdirectories of a directory
+
+    :param parentpath: The absolute path of the directory containing the archives
+    :type parentpath: string
+    :param dirpath: The path of the working directory
+    :type dirpath: string
+
+    :returns: The paths of the archives relative to the working directory
+    :rtype: generator
+    '''
+    with os.scandir(parentpath) as it:
+        for entry in it:
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "archive.db")):
+                yield os.path.relpath(entry.path, dirpath)
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
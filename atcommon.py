@@ -3,11 +3,19 @@
 
 import sys
 import sqlite3
+import pathlib
+import threading
+import contextlib
 
 __prog__ = "archivetube"
 __version__ = "0.5.0"
-__dbversion__ = 5
+__dbversion__ = 10
 __archivedbversion__ = 5
+__minsqliteversion__ = (3, 35, 0)
+__memorydburi__ = "file:archivetube?mode=memory&cache=shared"
+__cachedstatements__ = 256
+#Resolution class of a video (0: LD, 1: SD, 2: HD, 3: Full HD, 4: 4K, 5: 8K)
+__resClassSQL__ = "CASE WHEN max(width, height) >= 6000 THEN 5 WHEN max(width, height) >= 3500 THEN 4 WHEN max(width, height) >= 1900 THEN 3 WHEN max(width, height) >= 1200 THEN 2 WHEN max(width, height) < 700 AND min(width, height) < 400 THEN 0 ELSE 1 END"
 
 # --------------------------------------------------------------------------- #
 def connectDB(path, checkThread=True):
@@ -24,8 +32,12 @@ def connectDB(path, checkThread=True):
     :rtype: sqlite3.Connection
     '''
 
+    #Check SQLite version
+    checkSQLiteVersion()
+
     #Connect to database
-    dbCon = sqlite3.connect(path, check_same_thread=checkThread)
+    dbCon = sqlite3.connect(path, check_same_thread=checkThread, uri=True, cached_statements=__cachedstatements__)
+    setPragmas(dbCon)
 
     #Upgrade database
     upgradeDB(dbCon)
@@ -34,6 +46,88 @@ def connectDB(path, checkThread=True):
     return dbCon
 # ########################################################################### #
 
+# --------------------------------------------------------------------------- #
+def loadDB(path, checkThread=True):
+    '''Load existing db into the shared in-memory database and upgrade the
+    in-memory copy if necessary (the file is only read)
+
+    :param path: Path of the database file
+    :type path: string
+    :param checkThread: Whether sqlite3 should check the thread (default: True)
+    :type checkThread: boolean
+
+    :raises: :class:``sqlite3.Error: Unable to load database
+
+    :returns: Connection to the in-memory database and whether it was upgraded
+    :rtype: tuple
+    '''
+
+    #Check SQLite version
+    checkSQLiteVersion()
+
+    #Copy database into memory
+    fileDBCon = sqlite3.connect(readOnlyURI(path), uri=True)
+    dbCon = sqlite3.connect(__memorydburi__, check_same_thread=checkThread, uri=True, cached_statements=__cachedstatements__)
+    fileDBCon.backup(dbCon)
+    fileDBCon.close()
+    setPragmas(dbCon)
+
+    #Upgrade database
+    upgraded = upgradeDB(dbCon)
+
+    #Return database connection
+    return dbCon, upgraded
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def setPragmas(dbCon):
+    '''Set the journal mode and performance related pragmas of a connection
+
+    Uses write-ahead logging (readers don't block the writer and commits
+    only need to sync the log), a 64 MiB page cache, memory mapped I/O and
+    in-memory temporary tables. The journal mode is stored in the database
+    file, so it is only changed if the database doesn't use WAL yet. In-memory
+    databases only get the cache and temporary table settings
+
+    :param dbCon: Connection to the database
+    :type dbCon: sqlite3.Connection
+
+    :raises: :class:``sqlite3.Error: Unable to set pragmas
+    '''
+    journal = dbCon.execute("PRAGMA journal_mode;").fetchone()[0]
+    if journal != "memory":
+        if journal != "wal":
+            dbCon.execute("PRAGMA journal_mode=WAL;")
+        dbCon.execute("PRAGMA synchronous=NORMAL;")
+        dbCon.execute("PRAGMA mmap_size=268435456;")
+        #Wait for other connections instead of failing immediately if the database is locked
+        dbCon.execute("PRAGMA busy_timeout=5000;")
+    dbCon.execute("PRAGMA temp_store=MEMORY;")
+    dbCon.execute("PRAGMA cache_size=-65536;")
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def readOnlyURI(path):
+    '''Get the URI to open a database file in read-only mode
+
+    :param path: Absolute path of the database file
+    :type path: string
+
+    :returns: URI to be used with sqlite3.connect(uri, uri=True)
+    :rtype: string
+    '''
+    return "{}?mode=ro".format(pathlib.Path(path).as_uri())
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def checkSQLiteVersion():
+    '''Exit if the SQLite library is older than the minimum required version
+    (UPSERT and RETURNING support is needed)
+    '''
+    if sqlite3.sqlite_version_info < __minsqliteversion__:
+        sys.exit("ERROR: SQLite {} or newer required (found {})".format(".".join(str(v) for v in __minsqliteversion__), sqlite3.sqlite_version))
+# ########################################################################### #
+
 # --------------------------------------------------------------------------- #
 def createDB(path, checkThread=True):
     '''Create database with the required tables
@@ -75,10 +169,6 @@ def createDB(path, checkThread=True):
                        location TEXT,
                        joined TEXT,
                        links TEXT,
-                       profile BLOB,
-                       profileformat TEXT,
-                       banner BLOB,
-                       bannerformat TEXT,
                        videos INTEGER NOT NULL,
                        lastupdate INTEGER NOT NULL,
                        active INTEGER NOT NULL DEFAULT 0
@@ -92,8 +182,6 @@ def createDB(path, checkThread=True):
                      description TEXT,
                      subtitles TEXT,
                      filepath TEXT NOT NULL,
-                     thumb BLOB,
-                     thumbformat TEXT,
                      duration INTEGER,
                      tags TEXT,
                      language TEXT NOT NULL,
@@ -105,9 +193,25 @@ def createDB(path, checkThread=True):
                      dislikecount INTEGER,
                      statisticsupdated INTEGER NOT NULL,
                      active INTEGER NOT NULL DEFAULT 0,
-                     chapters TEXT
+                     chapters TEXT,
+                     resclass INTEGER GENERATED ALWAYS AS ({}) VIRTUAL
+                ); """.format(__resClassSQL__)
+
+    thumbsCmd = """ CREATE TABLE IF NOT EXISTS thumbs (
+                     id TEXT PRIMARY KEY UNIQUE NOT NULL,
+                     thumb BLOB,
+                     thumbformat TEXT,
+                     thumbsmall BLOB
                 ); """
 
+    channelImagesCmd = """ CREATE TABLE IF NOT EXISTS channelImages (
+                            id INTEGER PRIMARY KEY UNIQUE NOT NULL,
+                            profile BLOB,
+                            profileformat TEXT,
+                            banner BLOB,
+                            bannerformat TEXT
+                       ); """
+
     overallCmd = """ CREATE TABLE IF NOT EXISTS statsOverall (
                       id INTEGER PRIMARY KEY UNIQUE NOT NULL,
                       timestamp INTEGER NOT NULL,
@@ -165,28 +269,56 @@ def createDB(path, checkThread=True):
                    timestamp INTEGER NOT NULL,
                    png BLOB,
                    svgLight BLOB,
-                   svgDark BLOB
+                   svgDark BLOB,
+                   datahash TEXT
               ); """
 
+    #Check SQLite version
+    checkSQLiteVersion()
+
     #Create database
-    dbCon = sqlite3.connect(path, check_same_thread=checkThread)
+    dbCon = sqlite3.connect(path, check_same_thread=checkThread, uri=True, cached_statements=__cachedstatements__)
     db = dbCon.cursor()
     #Set encoding
     db.execute("pragma encoding=UTF8")
+    #Set journal mode and performance pragmas
+    setPragmas(dbCon)
     #Create tables
     db.execute(infoCmd)
     db.execute("INSERT INTO info(lastupdate, channels, videos, dbversion) VALUES(?,?,?,?)", (0, 0, 0, __dbversion__))
     db.execute(archivesCmd)
     db.execute(channelsCmd)
     db.execute(videosCmd)
+    db.execute(thumbsCmd)
+    db.execute(channelImagesCmd)
     db.execute(overallCmd)
     db.execute(weeklyCmd)
     db.execute(plotCmd)
+    #Create indexes
+    createIndexes(db)
     dbCon.commit()
     #Return database connection
     return dbCon
 # ########################################################################### #
 
+# --------------------------------------------------------------------------- #
+def createIndexes(db):
+    '''Create the indexes for the lookups done by the server and the statistics
+
+    :param db: Connection to the database
+    :type db: sqlite3.Connection or sqlite3.Cursor
+
+    :raises: :class:``sqlite3.Error: Unable to create indexes
+    '''
+    #Videos of a channel sorted by date (channel pages, next and previous video)
+    db.execute("CREATE INDEX IF NOT EXISTS idxVideosChannel ON videos(channelID, timestamp);")
+    #Videos by date with the columns aggregated by the statistics
+    db.execute("CREATE INDEX IF NOT EXISTS idxVideosStats ON videos(timestamp, resclass, duration);")
+    #Active videos and channels
+    db.execute("CREATE INDEX IF NOT EXISTS idxVideosActive ON videos(active) WHERE active = 1;")
+    db.execute("CREATE INDEX IF NOT EXISTS idxChannelsActive ON channels(active) WHERE active = 1;")
+# ########################################################################### #
+
 # --------------------------------------------------------------------------- #
 def upgradeDB(dbCon):
     '''Create database with the required tables
@@ -195,6 +327,9 @@ def upgradeDB(dbCon):
     :type dbCon: sqlite3.Connection
 
     :raises: :class:``sqlite3.Error: Unable to upgrade database
+
+    :returns: Whether the database was upgraded
+    :rtype: boolean
     '''
     db = dbCon.cursor()
 
@@ -207,22 +342,23 @@ def upgradeDB(dbCon):
         sys.exit("ERROR: Unsupported database!")
 
     #Check if not up to date
-    if version < __dbversion__:
+    upgraded = version < __dbversion__
+    if upgraded:
         print("Upgrading database")
         try:
             #Perform upgrade to version 2
             if version < 2:
-                #Clear video database
-                db.execute("DELETE FROM videos")
-                #Add new columns
-                db.execute('ALTER TABLE videos ADD COLUMN language TEXT NOT NULL;')
-                db.execute('ALTER TABLE videos ADD COLUMN width INTEGER NOT NULL;')
-                db.execute('ALTER TABLE videos ADD COLUMN height INTEGER NOT NULL;')
-                db.execute('ALTER TABLE videos ADD COLUMN resolution TEXT NOT NULL;')
-                db.execute('ALTER TABLE videos ADD COLUMN viewcount INTEGER;')
-                db.execute('ALTER TABLE videos ADD COLUMN likecount INTEGER;')
-                db.execute('ALTER TABLE videos ADD COLUMN dislikecount INTEGER;')
-                db.execute('ALTER TABLE videos ADD COLUMN statisticsupdated INTEGER NOT NULL;')
+                #Clear video database and add new columns
+                db.executescript(""" BEGIN;
+                                     DELETE FROM videos;
+                                     ALTER TABLE videos ADD COLUMN language TEXT NOT NULL;
+                                     ALTER TABLE videos ADD COLUMN width INTEGER NOT NULL;
+                                     ALTER TABLE videos ADD COLUMN height INTEGER NOT NULL;
+                                     ALTER TABLE videos ADD COLUMN resolution TEXT NOT NULL;
+                                     ALTER TABLE videos ADD COLUMN viewcount INTEGER;
+                                     ALTER TABLE videos ADD COLUMN likecount INTEGER;
+                                     ALTER TABLE videos ADD COLUMN dislikecount INTEGER;
+                                     ALTER TABLE videos ADD COLUMN statisticsupdated INTEGER NOT NULL; """)
                 #Update db version
                 version = 2
                 db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
@@ -230,8 +366,9 @@ def upgradeDB(dbCon):
             #Perform upgrade to version 3
             if version < 3:
                 #Add active channel and video column
-                db.execute('ALTER TABLE channels ADD COLUMN active INTEGER NOT NULL DEFAULT 0;')
-                db.execute('ALTER TABLE videos ADD COLUMN active INTEGER NOT NULL DEFAULT 0;')
+                db.executescript(""" BEGIN;
+                                     ALTER TABLE channels ADD COLUMN active INTEGER NOT NULL DEFAULT 0;
+                                     ALTER TABLE videos ADD COLUMN active INTEGER NOT NULL DEFAULT 0; """)
                 #Update db version
                 version = 3
                 db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
@@ -246,8 +383,6 @@ def upgradeDB(dbCon):
                 dbCon.commit()
             #Perform upgrade to version 5
             if version < 5:
-                #Add statistics updated to info
-                db.execute('ALTER TABLE info ADD COLUMN statisticsupdated INTEGER;')
                 #Add overall statistics table
                 overallCmd = """ CREATE TABLE IF NOT EXISTS statsOverall (
                                   id INTEGER PRIMARY KEY UNIQUE NOT NULL,
@@ -272,7 +407,6 @@ def upgradeDB(dbCon):
                                   totalDuration INTEGER NOT NULL,
                                   avgDuration REAL NOT NULL
                              ); """
-                db.execute(overallCmd)
                 #Add weekly statistics table
                 weeklyCmd = """ CREATE TABLE IF NOT EXISTS statsWeekly (
                                  id INTEGER PRIMARY KEY UNIQUE NOT NULL,
@@ -301,7 +435,6 @@ def upgradeDB(dbCon):
                                  totalDuration INTEGER NOT NULL,
                                  avgDuration REAL NOT NULL
                             ); """
-                db.execute(weeklyCmd)
                 #Add plots table
                 plotCmd = """ CREATE TABLE IF NOT EXISTS statsPlots (
                                name TEXT PRIMARY KEY UNIQUE NOT NULL,
@@ -310,15 +443,147 @@ def upgradeDB(dbCon):
                                svgLight BLOB,
                                svgDark BLOB
                           ); """
-                db.execute(plotCmd)
+                #Add statistics updated to info and create the statistics tables
+                db.executescript("BEGIN; ALTER TABLE info ADD COLUMN statisticsupdated INTEGER;" + overallCmd + weeklyCmd + plotCmd)
                 #Update db version
                 version = 5
                 db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
                 dbCon.commit()
+            #Perform upgrade to version 6
+            if version < 6:
+                #Move thumbnails to their own table (keeps the video rows small)
+                db.executescript(""" BEGIN;
+                                     CREATE TABLE IF NOT EXISTS thumbs (
+                                         id TEXT PRIMARY KEY UNIQUE NOT NULL,
+                                         thumb BLOB,
+                                         thumbformat TEXT
+                                     );
+                                     INSERT INTO thumbs(id, thumb, thumbformat) SELECT id, thumb, thumbformat FROM videos;
+                                     ALTER TABLE videos DROP COLUMN thumb;
+                                     ALTER TABLE videos DROP COLUMN thumbformat; """)
+                #Update db version
+                version = 6
+                db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
+                dbCon.commit()
+            #Perform upgrade to version 7
+            if version < 7:
+                #Remember which data the plots were rendered from
+                db.execute("ALTER TABLE statsPlots ADD COLUMN datahash TEXT;")
+                #Update db version
+                version = 7
+                db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
+                dbCon.commit()
+            #Perform upgrade to version 8
+            if version < 8:
+                #Add resolution class column and replace the timestamp index
+                db.executescript(""" BEGIN;
+                                     ALTER TABLE videos ADD COLUMN resclass INTEGER GENERATED ALWAYS AS ({}) VIRTUAL;
+                                     DROP INDEX IF EXISTS idxVideosTimestamp; """.format(__resClassSQL__))
+                createIndexes(db)
+                #Update db version
+                version = 8
+                db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
+                dbCon.commit()
+            #Perform upgrade to version 9
+            if version < 9:
+                #Add pre-rendered small thumbnails (filled during the next indexing)
+                db.execute("ALTER TABLE thumbs ADD COLUMN thumbsmall BLOB;")
+                #Update db version
+                version = 9
+                db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
+                dbCon.commit()
+            #Perform upgrade to version 10
+            if version < 10:
+                #Move profile pictures and banners to their own table (keeps the channel rows small)
+                db.executescript(""" BEGIN;
+                                     CREATE TABLE IF NOT EXISTS channelImages (
+                                         id INTEGER PRIMARY KEY UNIQUE NOT NULL,
+                                         profile BLOB,
+                                         profileformat TEXT,
+                                         banner BLOB,
+                                         bannerformat TEXT
+                                     );
+                                     INSERT INTO channelImages(id, profile, profileformat, banner, bannerformat) SELECT id, profile, profileformat, banner, bannerformat FROM channels;
+                                     ALTER TABLE channels DROP COLUMN profile;
+                                     ALTER TABLE channels DROP COLUMN profileformat;
+                                     ALTER TABLE channels DROP COLUMN banner;
+                                     ALTER TABLE channels DROP COLUMN bannerformat; """)
+                #Update db version
+                version = 10
+                db.execute("UPDATE info SET dbversion = ? WHERE id = 1", (version,))
+                dbCon.commit()
         except sqlite3.Error as e:
             dbCon.rollback()
             dbCon.close()
             sys.exit("ERROR: Unable to upgrade database (\"{}\")".format(e))
 
+    #Create the indexes that don't exist yet (e.g. in databases from before they were added)
+    try:
+        createIndexes(db)
+    except sqlite3.Error as e:
+        dbCon.close()
+        sys.exit("ERROR: Unable to create indexes (\"{}\")".format(e))
+
     dbCon.commit()
+    return upgraded
 # ########################################################################### #
+
+# =========================================================================== #
+class ConnectionPool():
+    '''
+    Pool of read-only database connections, one for every thread that reads
+    from the database
+    '''
+
+    # --------------------------------------------------------------------------- #
+    def __init__(self, readURI):
+        '''
+        Initialize the pool
+
+        :param readURI: The URI used to open the read-only connections
+        :type readURI: string
+
+        :raises: :class:``sqlite3.Error: Unable to open connections
+        '''
+        self._readURI = readURI
+        self._local = threading.local()
+        #Open the connection of the calling thread right away to report errors early
+        self._getReadCon()
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def _getReadCon(self):
+        '''
+        Get the read-only connection of the current thread, opens it on first use
+
+        :raises: :class:``sqlite3.Error: Unable to open connection
+
+        :returns: Read-only connection to the database
+        :rtype: sqlite3.Connection
+        '''
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self._readURI, uri=True, cached_statements=__cachedstatements__)
+            #Page cache, memory mapping and busy timeout are per connection settings
+            setPragmas(con)
+            con.execute("PRAGMA query_only=1;")
+            con.row_factory = sqlite3.Row
+            self._local.con = con
+        return con
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    @contextlib.contextmanager
+    def read(self):
+        '''
+        Get the read-only connection of the current thread
+
+        :raises: :class:``sqlite3.Error: Unable to open connection
+
+        :returns: Read-only connection to the database
+        :rtype: sqlite3.Connection
+        '''
+        yield self._getReadCon()
+    # ########################################################################### #
+
+# /////////////////////////////////////////////////////////////////////////// #
@@ -7,13 +7,33 @@ import sys
 import sqlite3
 import argparse
 import time
-from datetime import datetime, timezone
+import hashlib
+import concurrent.futures
+from datetime import datetime, timezone, timedelta
+import numpy as np
 from scipy.signal import savgol_filter as sf
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
 import matplotlib.dates as md
 import atcommon as atc
 
 __startMidweek__ = 1108641600 #Timestamp middle of the week (thursday noon) of the founding week of Youtube (Feb 14 2005)
+__colorLight__ = "#0b0c0d"
+__colorDark__ = "#eef0f1"
+__color1__ = "#37702e"
+__color2__ = "#78994b"
+__color3__ = "#bac36e"
+__color4__ = "#f8b768"
+__color5__ = "#ec7d52"
+__color6__ = "#d43d51"
+__linewidth__ = 1.3
+__figWidth__ = 12.45
+__figHeight__ = 5.8
+__figDPI__ = 150
+__figRect__ = (0, 0, 1, 0.95)
+__titleY__ = 0.98
+__legendLoc__ = (0.5, 0.95)
+__plotStyle__ = {"font.size": 7, "grid.linestyle": "--", "grid.color": "#8f8f8f", "grid.alpha": 0.5, "axes.edgecolor": __colorLight__}
 
 # --------------------------------------------------------------------------- #
 def main(args):
@@ -23,8 +43,9 @@ def main(args):
     :type args: list
     '''
     parser = argparse.ArgumentParser(prog="atstatistics", description="Calculate statistics for archived videos")
-    parser.add_argument("-m", "--memory", action="store_const", dest="memory", const=True, default=False, help="Keep whole database in memory (faster, but requires a lot of memory)")
+    parser.add_argument("-m", "--memory", action="store_const", dest="memory", const=True, default=False, help="Deprecated, has no effect (the database is used in WAL mode with a large page cache)")
     parser.add_argument("-v", "--verbose", action="store_const", dest="verbose", const=True, default=False, help="Print more status info")
+    parser.add_argument("-d", "--dpi", action="store", dest="dpi", type=int, default=__figDPI__, help="Resolution of the png plots (Default: {})".format(__figDPI__))
     parser.add_argument("-V", "--version", action="version", version='%(prog)s {}'.format(atc.__version__))
     parser.add_argument("DIR", help="The directory to work in")
     group = parser.add_mutually_exclusive_group()
@@ -47,7 +68,7 @@ def main(args):
         taskCalc = False
 
     if args.memory:
-        print("Using in-memory database")
+        print("Option -m/--memory is deprecated and has no effect")
 
     #Check if database exists
     dbPath = os.path.join(path, "tube.db")
@@ -55,15 +76,10 @@ def main(args):
         if os.path.isfile(dbPath):
             #Connect to database
             t1 = time.perf_counter()
-            if args.memory:
-                print("Reading existing database")
-                fileDBCon = atc.connectDB(dbPath)
-                dbCon = sqlite3.connect(":memory:")
-                fileDBCon.backup(dbCon)
-                fileDBCon.close()
-            else:
-                print("Connect to existing database")
-                dbCon = atc.connectDB(dbPath)
+            print("Connect to existing database")
+            dbCon = atc.connectDB(dbPath)
+            #Larger page cache for the sequential scans over the videos table
+            dbCon.execute("PRAGMA cache_size=-262144;")
             t2 = time.perf_counter()
             t = t2 - t1
             if args.verbose:
@@ -77,30 +93,14 @@ def main(args):
 
     errorMsg = ""
     try:
-        run(db, taskCalc, taskPlot, args.verbose)
+        #Take the write lock up front and commit everything at once
+        db.execute("BEGIN IMMEDIATE;")
+        run(db, taskCalc, taskPlot, args.verbose, args.dpi)
         dbCon.commit()
     except StatisticsError as e:
         errorMsg = "ERROR: " + str(e)
-
-
-    #Write changes to database
-    if args.memory:
-        if errorMsg:
-            print("Error occurred, writing database before exiting")
-        else:
-            print("Writing new database")
-        t1 = time.perf_counter()
-        try:
-            os.remove(dbPath)
-        except OSError:
-            pass
-        fileDBCon = sqlite3.connect(dbPath)
-        dbCon.backup(fileDBCon)
-        fileDBCon.close()
-        t2 = time.perf_counter()
-        t = t2 - t1
-        if args.verbose:
-            print("Write time: {:0.4f} seconds".format(t))
+    except sqlite3.Error as e:
+        errorMsg = "ERROR: Database error \"{}\"".format(e)
 
     if errorMsg:
         sys.exit(errorMsg)
@@ -109,7 +109,7 @@ def main(args):
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
-def run(db, runCalc=True, runPlot=True, verbose=False):
+def run(db, runCalc=True, runPlot=True, verbose=False, dpi=__figDPI__):
     '''The main atstatistics function
 
     :param db: Connection to the tube database
@@ -120,6 +120,8 @@ def run(db, runCalc=True, runPlot=True, verbose=False):
     :type runPlot: boolean, optional
     :param verbose: Whether to print more status messages (Default: False)
     :type verbose: boolean, optional
+    :param dpi: The resolution of the png plots (Default: 150)
+    :type dpi: integer, optional
 
     :raises: :class:``StatisticsError: An error occurred
     '''
@@ -132,7 +134,7 @@ def run(db, runCalc=True, runPlot=True, verbose=False):
             print("Calculation time: {:0.4f} seconds".format(t))
     if runPlot:
         t1 = time.perf_counter()
-        plot(db, verbose)
+        plot(db, verbose, dpi)
         t2 = time.perf_counter()
         t = t2 - t1
         if verbose:
@@ -184,87 +186,57 @@ def calculate(db, verbose=False, veryverbose=False):
     totalSubtitles = 0
     totalChapters = 0
     totalTotalDuration = 0
-
-    #Loop through all weeks
-    for midweek in range(__startMidweek__, currentTime-halfweek, week):
-        #Setup
-        start = midweek - halfweek
-        end = midweek + halfweek - 1
-        #If earlier than oldest video, skip
-        if end < oldest:
-            continue
+    weeklyRows = []
+
+    #Count videos per week (week n starts at the monday midnight before __startMidweek__ + n weeks)
+    firstStart = __startMidweek__ - halfweek
+    weeks = range(__startMidweek__, currentTime-halfweek, week)
+    cmd = """ SELECT (timestamp - :first) / :week AS n,
+                     count(*) AS videos,
+                     sum(resclass = 5) AS v8k,
+                     sum(resclass = 4) AS v4k,
+                     sum(resclass = 3) AS vFullHD,
+                     sum(resclass = 2) AS vHD,
+                     sum(resclass = 1) AS vSD,
+                     sum(resclass = 0) AS vLD,
+                     sum(coalesce(subtitles, '') != '') AS subtitles,
+                     sum(coalesce(chapters, '') != '') AS chapters,
+                     coalesce(sum(duration), 0) AS totalDuration
+              FROM videos WHERE timestamp >= :first AND timestamp < :last GROUP BY n; """
+    try:
+        r = db.execute(cmd, {"first": firstStart, "week": week, "last": firstStart + len(weeks) * week})
+        weekly = {row[0]: row[1:] for row in r}
+        del r
+    except sqlite3.Error as e:
+        raise StatisticsError("Database error reading video data (Error: \"{}\")".format(e)) from e
+
+    #Bind frequently used functions to locals for the loop
+    fromTimestamp = datetime.fromtimestamp
+    utc = timezone.utc
+    threeDays = timedelta(days=3)
+    addRow = weeklyRows.append
+
+    #Report empty weeks since the oldest video
+    if veryverbose:
+        for n in range(max((oldest - firstStart) // week, 0), len(weeks)):
+            if n not in weekly:
+                print("No videos in week {}-{}".format(*fromTimestamp(weeks[n], tz=utc).isocalendar()[:2]))
+
+    #Loop through the weeks with videos
+    for n in sorted(weekly):
         #Convert dates
-        dtMidweek = datetime.fromtimestamp(midweek, tz=timezone.utc)
-        year = int(datetime.strftime(dtMidweek, "%Y"))
-        week = int(datetime.strftime(dtMidweek, "%V"))
-        monday = datetime.strftime(datetime.fromtimestamp(start, tz=timezone.utc), "%Y-%m-%d")
-        sunday = datetime.strftime(datetime.fromtimestamp(end, tz=timezone.utc), "%Y-%m-%d")
-        weekid = int(datetime.strftime(dtMidweek, "%Y%V"))
-
-        #Get videos in weeks
-        try:
-            r = db.execute("SELECT width,height,duration,subtitles,chapters FROM videos WHERE timestamp BETWEEN ? AND ?;", (start, end))
-            vids = r.fetchall()
-            del r
-        except (sqlite3.Error, TypeError) as e:
-            raise StatisticsError("Database error reading data in week {}-{} (Error: \"{}\")".format(year, week, e)) from e
-
-        if not vids:
-            if veryverbose:
-                print("No videos in week {}-{}".format(year, week))
-            continue
+        midweek = weeks[n]
+        dtMidweek = fromTimestamp(midweek, tz=utc)
+        year, week = dtMidweek.isocalendar()[:2] #Midweek is a thursday, so the ISO year is the calendar year
+        monday = (dtMidweek - threeDays).date().isoformat()
+        sunday = (dtMidweek + threeDays).date().isoformat()
+        weekid = year * 100 + week
+
+        #Get counts
+        videos, videos8k, videos4k, videosFullHD, videosHD, videosSD, videosLD, subtitles, chapters, totalDuration = weekly[n]
 
         if veryverbose:
-            print("{} videos in week {}-{}".format(len(vids), year, week))
-
-        #Initialize
-        videos = len(vids)
-        videos8k = 0
-        videos4k = 0
-        videosFullHD = 0
-        videosHD = 0
-        videosSD = 0
-        videosLD = 0
-        subtitles = 0
-        chapters = 0
-        totalDuration = 0
-
-        #Loop through videos
-        for video in vids:
-            #Get video resolution
-            larger = video["width"] if video["width"] > video["height"] else video["height"]
-            smaller = video["height"] if video["width"] > video["height"] else video["width"]
-            if larger < 1200:
-                if larger < 700 and smaller < 400:
-                    #LD video
-                    videosLD += 1
-                else:
-                    #SD video
-                    videosSD += 1
-            elif 1200 <= larger < 1900:
-                #HD video
-                videosHD += 1
-            elif 1900 <= larger < 3500:
-                #Full HD video
-                videosFullHD += 1
-            elif 3500 <= larger < 6000:
-                #4K video
-                videos4k += 1
-            else:
-                #8K video
-                videos8k += 1
-
-            #Get video duration
-            if video["duration"]:
-                totalDuration += video["duration"]
-
-            #Get subtitles
-            if video["subtitles"]:
-                subtitles += 1
-
-            #Get chapters
-            if video["chapters"]:
-                chapters += 1
+            print("{} videos in week {}-{}".format(videos, year, week))
 
         #Calculate fractions
         fraction8k = videos8k/videos
@@ -277,16 +249,8 @@ def calculate(db, verbose=False, veryverbose=False):
         fractionChap = chapters/videos
         avgDuration = totalDuration/videos
 
-        #Write data
-        try:
-            cmd = "INSERT INTO statsWeekly(id,timestamp,year,week,mondaydate,sundaydate,videos,v8k,fraction8k,v4k,fraction4k,vFullHD,fractionFullHD,vHD,fractionHD,vSD,fractionSD,vLD,fractionLD,subtitles,fractionSubtitles,chapters,fractionChapters,totalDuration,avgDuration) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
-            db.execute(cmd, (weekid, midweek, year, week, monday, sunday, videos, videos8k, fraction8k, videos4k, fraction4k, videosFullHD, fractionFullHD, videosHD, fractionHD, videosSD, fractionSD, videosLD, fractionLD, subtitles, fractionSub, chapters, fractionChap, totalDuration, avgDuration))
-        except sqlite3.Error:
-            try:
-                cmd = "UPDATE statsWeekly SET timestamp=?,year=?,week=?,mondaydate=?,sundaydate=?,videos=?,v8k=?,fraction8k=?,v4k=?,fraction4k=?,vFullHD=?,fractionFullHD=?,vHD=?,fractionHD=?,vSD=?,fractionSD=?,vLD=?,fractionLD=?,subtitles=?,fractionSubtitles=?,chapters=?,fractionChapters=?,totalDuration=?,avgDuration=? WHERE id=?"
-                db.execute(cmd, (midweek, year, week, monday, sunday, videos, videos8k, fraction8k, videos4k, fraction4k, videosFullHD, fractionFullHD, videosHD, fractionHD, videosSD, fractionSD, videosLD, fractionLD, subtitles, fractionSub, chapters, fractionChap, totalDuration, avgDuration, weekid))
-            except sqlite3.Error as e:
-                raise StatisticsError("Database error writing data in week {}-{} (Error: \"{}\")".format(year, week, e)) from e
+        #Add data
+        addRow((weekid, midweek, year, week, monday, sunday, videos, videos8k, fraction8k, videos4k, fraction4k, videosFullHD, fractionFullHD, videosHD, fractionHD, videosSD, fractionSD, videosLD, fractionLD, subtitles, fractionSub, chapters, fractionChap, totalDuration, avgDuration))
 
         #Update total statistics
         totalVideos += videos
@@ -300,6 +264,13 @@ def calculate(db, verbose=False, veryverbose=False):
         totalChapters += chapters
         totalTotalDuration += totalDuration
 
+    #Write weekly data
+    try:
+        cmd = "INSERT INTO statsWeekly(id,timestamp,year,week,mondaydate,sundaydate,videos,v8k,fraction8k,v4k,fraction4k,vFullHD,fractionFullHD,vHD,fractionHD,vSD,fractionSD,vLD,fractionLD,subtitles,fractionSubtitles,chapters,fractionChapters,totalDuration,avgDuration) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?) ON CONFLICT(id) DO UPDATE SET timestamp=excluded.timestamp,year=excluded.year,week=excluded.week,mondaydate=excluded.mondaydate,sundaydate=excluded.sundaydate,videos=excluded.videos,v8k=excluded.v8k,fraction8k=excluded.fraction8k,v4k=excluded.v4k,fraction4k=excluded.fraction4k,vFullHD=excluded.vFullHD,fractionFullHD=excluded.fractionFullHD,vHD=excluded.vHD,fractionHD=excluded.fractionHD,vSD=excluded.vSD,fractionSD=excluded.fractionSD,vLD=excluded.vLD,fractionLD=excluded.fractionLD,subtitles=excluded.subtitles,fractionSubtitles=excluded.fractionSubtitles,chapters=excluded.chapters,fractionChapters=excluded.fractionChapters,totalDuration=excluded.totalDuration,avgDuration=excluded.avgDuration"
+        db.executemany(cmd, weeklyRows)
+    except sqlite3.Error as e:
+        raise StatisticsError("Database error writing weekly data (Error: \"{}\")".format(e)) from e
+
     if verbose:
         print("Writing overall statistic")
 
@@ -329,13 +300,15 @@ def calculate(db, verbose=False, veryverbose=False):
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
-def plot(db, verbose=False):
+def plot(db, verbose=False, dpi=__figDPI__):
     '''Create plots from statistics
 
     :param db: Connection to the tube database
     :type db: sqlite3.Cursor
     :param verbose: Whether to print more status messages (Default: False)
     :type verbose: boolean, optional
+    :param dpi: The resolution of the png plots (Default: 150)
+    :type dpi: integer, optional
 
     :raises: :class:``StatisticsError: An error occurred during plotting
     '''
@@ -347,252 +320,258 @@ def plot(db, verbose=False):
     try:
         r = db.execute("SELECT timestamp,videos,fraction8k,fraction4k,fractionFullHD,fractionHD,fractionSD,fractionLD,fractionSubtitles,fractionChapters,avgDuration FROM statsWeekly")
         weeks = r.fetchall()
+        #The overall counts tell which resolutions occur at all
+        r = db.execute("SELECT v8k,v4k,vFullHD,vHD,vSD,vLD FROM statsOverall ORDER BY id DESC LIMIT 1;")
+        overall = r.fetchone()
+        #Hashes of the data the existing plots were rendered from
+        r = db.execute("SELECT name,datahash FROM statsPlots;")
+        oldHashes = {row[0]: row[1] for row in r}
         del r
     except (sqlite3.Error, AttributeError) as e:
         raise StatisticsError("Database error reading data for plotting (Error: \"{}\")".format(e)) from e
 
     #Parse data
-    dt = []
-    videos = []
-    fraction8k = []
-    fraction4k = []
-    fractionFullHD = []
-    fractionHD = []
-    fractionSD = []
-    fractionLD = []
-    fractionSub = []
-    fractionChap = []
-    avgDuration = []
-    for week in weeks:
-        dt.append(datetime.fromtimestamp(week["timestamp"]))
-        videos.append(week["videos"])
-        fraction8k.append(week["fraction8k"]*100)
-        fraction4k.append(week["fraction4k"]*100)
-        fractionFullHD.append(week["fractionFullHD"]*100)
-        fractionHD.append(week["fractionHD"]*100)
-        fractionSD.append(week["fractionSD"]*100)
-        fractionLD.append(week["fractionLD"]*100)
-        fractionSub.append(week["fractionSubtitles"]*100)
-        fractionChap.append(week["fractionChapters"]*100)
-        avgDuration.append(week["avgDuration"]/60)
-    dt = md.date2num(dt)
-    #Smooth data
+    data = np.array(weeks, dtype=np.float64)
+    del weeks
+    #Skip plots whose data did not change since they were last rendered
+    h = hashlib.blake2b(digest_size=16)
+    h.update("{} {}".format(atc.__version__, dpi).encode())
+    h.update(repr(tuple(overall) if overall else None).encode())
+    h.update(np.ascontiguousarray(data).tobytes())
+    dataHash = h.hexdigest()
+    outdated = [name for name in ("resolutions", "features", "content") if oldHashes.get(name) != dataHash]
+    if not outdated:
+        if verbose:
+            print("Plots are up to date")
+        return
+    dt = md.date2num([datetime.fromtimestamp(t) for t in data[:, 0]])
+    videos = data[:, 1]
+    avgDuration = data[:, 10]/60
+    #Smooth all fraction columns at once
     windowLength = 13
     polynomial = 3
-    fraction8k = sf(fraction8k, windowLength, polynomial)
-    fraction4k = sf(fraction4k, windowLength, polynomial)
-    fractionFullHD = sf(fractionFullHD, windowLength, polynomial)
-    fractionHD = sf(fractionHD, windowLength, polynomial)
-    fractionSD = sf(fractionSD, windowLength, polynomial)
-    fractionLD = sf(fractionLD, windowLength, polynomial)
-    fractionSub = sf(fractionSub, windowLength, polynomial)
-    fractionChap = sf(fractionChap, windowLength, polynomial)
-
-    #General settings
-    plt.rcParams.update({'font.size': 7})
-    colorLight = "#0b0c0d"
-    colorDark = "#eef0f1"
-    color1 = "#37702e"
-    color2 = "#78994b"
-    color3 = "#bac36e"
-    color4 = "#f8b768"
-    color5 = "#ec7d52"
-    color6 = "#d43d51"
-    plt.rc("grid", linestyle="--", color="#8f8f8f", alpha=0.5)
-    plt.rc("axes", edgecolor=colorLight)
-    linewidth = 1.3
-    figWidth = 12.45
-    figHeight = 5.8
-    figDPI = 300
-    figRect = (0, 0, 1, 0.95)
-    titleY = 0.98
-    legendLoc = (0.5, 0.95)
-
-    #Resolution plot
+    fractions = sf(data[:, 2:10]*100, windowLength, polynomial, axis=0)
+    fraction8k, fraction4k, fractionFullHD, fractionHD, fractionSD, fractionLD, fractionSub, fractionChap = fractions.T
+    #Only plot resolutions that occur in the archive
+    if overall:
+        available = tuple(v > 0 for v in overall)
+    else:
+        available = tuple(f.any() for f in (fraction8k, fraction4k, fractionFullHD, fractionHD, fractionSD, fractionLD))
+
+    #Render plots in parallel (rendering is CPU bound and the plots are independent)
     if verbose:
-        print("Plotting resolution over time")
+        print("Rendering plots")
+    tasks = {"resolutions": (plotResolutions, dt, fraction8k, fraction4k, fractionFullHD, fractionHD, fractionSD, fractionLD, available, dpi),
+             "features": (plotFeatures, dt, fractionSub, fractionChap, dpi),
+             "content": (plotContent, dt, avgDuration, videos, dpi)}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(outdated)) as executor:
+        futures = {name: executor.submit(*tasks[name]) for name in outdated}
+        plots = {name: future.result() for name, future in futures.items()}
+
+    #Write to database
+    for name, data in plots.items():
+        updateOrInsertPlot(db, name, *data, dataHash)
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+@matplotlib.rc_context(__plotStyle__)
+def plotResolutions(dt, fraction8k, fraction4k, fractionFullHD, fractionHD, fractionSD, fractionLD, available, dpi):
+    '''Plot the resolution of the videos over time
+
+    :param dt: The dates of the weeks
+    :type dt: numpy.ndarray
+    :param fraction8k: The smoothed weekly 8K fractions in percent
+    :type fraction8k: numpy.ndarray
+    :param fraction4k: The smoothed weekly 4K fractions in percent
+    :type fraction4k: numpy.ndarray
+    :param fractionFullHD: The smoothed weekly Full HD fractions in percent
+    :type fractionFullHD: numpy.ndarray
+    :param fractionHD: The smoothed weekly HD fractions in percent
+    :type fractionHD: numpy.ndarray
+    :param fractionSD: The smoothed weekly SD fractions in percent
+    :type fractionSD: numpy.ndarray
+    :param fractionLD: The smoothed weekly LD fractions in percent
+    :type fractionLD: numpy.ndarray
+    :param available: Whether there are 8K, 4K, Full HD, HD, SD and LD videos
+    :type available: tuple
+    :param dpi: The resolution of the png
+    :type dpi: integer
+
+    :returns: The png, light svg and dark svg data
+    :rtype: tuple
+    '''
     #Setup plot
-    fig, ax = plt.subplots()
-    fig.set_size_inches(figWidth, figHeight)
-    t = fig.suptitle('Video image resolution over time', y=titleY)
+    fig = Figure(figsize=(__figWidth__, __figHeight__))
+    ax = fig.add_subplot()
+    t = fig.suptitle('Video image resolution over time', y=__titleY__)
     ax.set_ylabel('Fraction of weekly videos [%]')
-    ax.set_xlabel('Time')
-    xfmt = md.DateFormatter('%Y')
-    ax.xaxis.set_major_formatter(xfmt)
-    ax.xaxis.set_major_locator(md.YearLocator())
-    ax.xaxis.set_minor_locator(md.MonthLocator())
+    setTimeAxis(ax, dt)
     ax.set_ylim(ymin=0, ymax=105)
-    ax.set_xlim(dt[0], dt[-1])
     #Add data
-    if max(fraction8k) > 0:
-        ax.plot_date(dt, fraction8k, '-', label="8K", linewidth=linewidth, color=color1)
-    if max(fraction4k) > 0:
-        ax.plot_date(dt, fraction4k, '-', label="4K", linewidth=linewidth, color=color2)
-    if max(fractionFullHD) > 0:
-        ax.plot_date(dt, fractionFullHD, '-', label="FullHD", linewidth=linewidth, color=color3)
-    if max(fractionHD) > 0:
-        ax.plot_date(dt, fractionHD, '-', label="HD", linewidth=linewidth, color=color4)
-    if max(fractionSD) > 0:
-        ax.plot_date(dt, fractionSD, '-', label="SD", linewidth=linewidth, color=color5)
-    if max(fractionLD) > 0:
-        ax.plot_date(dt, fractionLD, '-', label="LD", linewidth=linewidth, color=color6)
-    #Setup
-    l = fig.legend(loc='upper center', bbox_to_anchor=legendLoc, ncol=6, edgecolor=colorLight)
-    l.get_frame().set_alpha(None)
-    l.get_frame().set_facecolor((0, 0, 0, 0))
-    for text in l.get_texts():
-        text.set_color(colorLight)
-    ax.tick_params(which="both", colors=colorLight, labelcolor=colorLight)
-    for spine in ax.spines.values():
-        spine.set_edgecolor(colorLight)
-    ax.xaxis.label.set_color(colorLight)
-    ax.yaxis.label.set_color(colorLight)
-    t.set_color(colorLight)
+    has8k, has4k, hasFullHD, hasHD, hasSD, hasLD = available
+    if has8k:
+        ax.plot_date(dt, fraction8k, '-', label="8K", linewidth=__linewidth__, color=__color1__)
+    if has4k:
+        ax.plot_date(dt, fraction4k, '-', label="4K", linewidth=__linewidth__, color=__color2__)
+    if hasFullHD:
+        ax.plot_date(dt, fractionFullHD, '-', label="FullHD", linewidth=__linewidth__, color=__color3__)
+    if hasHD:
+        ax.plot_date(dt, fractionHD, '-', label="HD", linewidth=__linewidth__, color=__color4__)
+    if hasSD:
+        ax.plot_date(dt, fractionSD, '-', label="SD", linewidth=__linewidth__, color=__color5__)
+    if hasLD:
+        ax.plot_date(dt, fractionLD, '-', label="LD", linewidth=__linewidth__, color=__color6__)
     ax.grid(True)
-    fig.tight_layout(rect=figRect)
-    png = io.BytesIO()
-    svgLight = io.BytesIO()
-    svgDark = io.BytesIO()
-    #Generate png
-    plt.savefig(png, format="png", dpi=figDPI)
-    #Generate light svg
-    plt.savefig(svgLight, format="svg", dpi=figDPI, transparent=True)
-    #Generate dark svg
-    ax.tick_params(which="both", colors=colorDark, labelcolor=colorDark)
-    for spine in ax.spines.values():
-        spine.set_edgecolor(colorDark)
-    ax.xaxis.label.set_color(colorDark)
-    ax.yaxis.label.set_color(colorDark)
-    t.set_color(colorDark)
-    l.get_frame().set_edgecolor(colorDark)
-    for text in l.get_texts():
-        text.set_color(colorDark)
-    plt.savefig(svgDark, format="svg", dpi=figDPI, transparent=True)
-    #Write to database
-    updateOrInsertPlot(db, "resolutions", png, svgLight, svgDark)
+    #Render
+    return renderPlot(fig, [ax], t, dpi)
+# ########################################################################### #
 
-    #Features plot
-    if verbose:
-        print("Plotting features over time")
+# --------------------------------------------------------------------------- #
+@matplotlib.rc_context(__plotStyle__)
+def plotFeatures(dt, fractionSub, fractionChap, dpi):
+    '''Plot the features of the videos over time
+
+    :param dt: The dates of the weeks
+    :type dt: numpy.ndarray
+    :param fractionSub: The smoothed weekly fractions of videos with subtitles in percent
+    :type fractionSub: numpy.ndarray
+    :param fractionChap: The smoothed weekly fractions of videos with chapters in percent
+    :type fractionChap: numpy.ndarray
+    :param dpi: The resolution of the png
+    :type dpi: integer
+
+    :returns: The png, light svg and dark svg data
+    :rtype: tuple
+    '''
     #Setup plot
-    fig, ax = plt.subplots()
-    fig.set_size_inches(figWidth, figHeight)
-    t = fig.suptitle('Video features over time', y=titleY)
+    fig = Figure(figsize=(__figWidth__, __figHeight__))
+    ax = fig.add_subplot()
+    t = fig.suptitle('Video features over time', y=__titleY__)
     ax.set_ylabel('Fraction of weekly videos [%]')
-    ax.set_xlabel('Time')
-    xfmt = md.DateFormatter('%Y')
-    ax.xaxis.set_major_formatter(xfmt)
-    ax.xaxis.set_major_locator(md.YearLocator())
-    ax.xaxis.set_minor_locator(md.MonthLocator())
+    setTimeAxis(ax, dt)
     ax.set_ylim(ymin=0, ymax=105)
-    ax.set_xlim(dt[0], dt[-1])
     #Add data
-    ax.plot_date(dt, fractionSub, '-', label="Subtitles", linewidth=linewidth, color=color1)
-    ax.plot_date(dt, fractionChap, '-', label="Chapters", linewidth=linewidth, color=color6)
-    #Setup
-    l = fig.legend(loc='upper center', bbox_to_anchor=legendLoc, ncol=6, edgecolor=colorLight)
-    l.get_frame().set_alpha(None)
-    l.get_frame().set_facecolor((0, 0, 0, 0))
-    for text in l.get_texts():
-        text.set_color(colorLight)
-    ax.tick_params(which="both", colors=colorLight, labelcolor=colorLight)
-    for spine in ax.spines.values():
-        spine.set_edgecolor(colorLight)
-    ax.xaxis.label.set_color(colorLight)
-    ax.yaxis.label.set_color(colorLight)
-    t.set_color(colorLight)
+    ax.plot_date(dt, fractionSub, '-', label="Subtitles", linewidth=__linewidth__, color=__color1__)
+    ax.plot_date(dt, fractionChap, '-', label="Chapters", linewidth=__linewidth__, color=__color6__)
     ax.grid(True)
-    fig.tight_layout(rect=figRect)
-    png = io.BytesIO()
-    svgLight = io.BytesIO()
-    svgDark = io.BytesIO()
-    #Generate png
-    plt.savefig(png, format="png", dpi=figDPI)
-    #Generate light svg
-    plt.savefig(svgLight, format="svg", dpi=figDPI, transparent=True)
-    #Generate dark svg
-    ax.tick_params(which="both", colors=colorDark, labelcolor=colorDark)
-    for spine in ax.spines.values():
-        spine.set_edgecolor(colorDark)
-    ax.xaxis.label.set_color(colorDark)
-    ax.yaxis.label.set_color(colorDark)
-    t.set_color(colorDark)
-    l.get_frame().set_edgecolor(colorDark)
-    for text in l.get_texts():
-        text.set_color(colorDark)
-    plt.savefig(svgDark, format="svg", dpi=figDPI, transparent=True)
-    #Write to database
-    updateOrInsertPlot(db, "features", png, svgLight, svgDark)
+    #Render
+    return renderPlot(fig, [ax], t, dpi)
+# ########################################################################### #
 
-    #Content plot
-    if verbose:
-        print("Plotting content over time")
+# --------------------------------------------------------------------------- #
+@matplotlib.rc_context(__plotStyle__)
+def plotContent(dt, avgDuration, videos, dpi):
+    '''Plot the number and the length of the videos over time
+
+    :param dt: The dates of the weeks
+    :type dt: numpy.ndarray
+    :param avgDuration: The average weekly video length in minutes
+    :type avgDuration: numpy.ndarray
+    :param videos: The number of weekly videos
+    :type videos: numpy.ndarray
+    :param dpi: The resolution of the png
+    :type dpi: integer
+
+    :returns: The png, light svg and dark svg data
+    :rtype: tuple
+    '''
     #Setup plot
-    fig, ax1 = plt.subplots()
-    fig.set_size_inches(figWidth, figHeight)
-    t = fig.suptitle('Weekly videos and video length over time', y=titleY)
+    fig = Figure(figsize=(__figWidth__, __figHeight__))
+    ax1 = fig.add_subplot()
+    t = fig.suptitle('Weekly videos and video length over time', y=__titleY__)
     ax1.set_ylabel('Average weekly videos length [min]')
-    ax1.set_xlabel('Time')
     ax2 = ax1.twinx()
     ax2.set_ylabel('Number of weekly videos')
-    xfmt = md.DateFormatter('%Y')
-    ax1.xaxis.set_major_formatter(xfmt)
-    ax1.xaxis.set_major_locator(md.YearLocator())
-    ax1.xaxis.set_minor_locator(md.MonthLocator())
-    ax1.set_xlim(dt[0], dt[-1])
+    setTimeAxis(ax1, dt)
     ax1.set_ylim(0, max(avgDuration)*1.05)
     ax2.set_ylim(0, max(videos)*1.05)
     #Add data
-    ax1.plot_date(dt, avgDuration, '-', label="Avg. duration", linewidth=linewidth, color=color6)
-    ax2.bar(dt, videos, width=5, alpha=0.7, label="Weekly videos", color=color1)
-    #Setup
-    l = fig.legend(loc='upper center', bbox_to_anchor=legendLoc, ncol=6, edgecolor=colorLight)
-    l.get_frame().set_alpha(None)
-    l.get_frame().set_facecolor((0, 0, 0, 0))
-    for text in l.get_texts():
-        text.set_color(colorLight)
-    ax1.tick_params(which="both", colors=colorLight, labelcolor=colorLight)
-    ax2.tick_params(which="both", colors=colorLight, labelcolor=colorLight)
-    for spine in ax1.spines.values():
-        spine.set_edgecolor(colorLight)
-    for spine in ax2.spines.values():
-        spine.set_edgecolor(colorLight)
-    ax1.xaxis.label.set_color(colorLight)
-    ax1.yaxis.label.set_color(colorLight)
-    ax2.yaxis.label.set_color(colorLight)
-    t.set_color(colorLight)
+    ax1.plot_date(dt, avgDuration, '-', label="Avg. duration", linewidth=__linewidth__, color=__color6__)
+    ax2.bar(dt, videos, width=5, alpha=0.7, label="Weekly videos", color=__color1__)
     ax1.set_zorder(ax2.get_zorder()+1)
     ax1.grid(True)
     ax1.patch.set_visible(False)
-    fig.tight_layout(rect=figRect)
+    #Render
+    return renderPlot(fig, [ax1, ax2], t, dpi)
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def setTimeAxis(ax, dt):
+    '''Set up a yearly labeled time axis covering the whole statistics period
+
+    :param ax: The axes
+    :type ax: matplotlib.axes.Axes
+    :param dt: The dates of the weeks
+    :type dt: numpy.ndarray
+    '''
+    ax.set_xlabel('Time')
+    ax.xaxis.set_major_formatter(md.DateFormatter('%Y'))
+    ax.xaxis.set_major_locator(md.YearLocator())
+    ax.xaxis.set_minor_locator(md.MonthLocator())
+    ax.set_xlim(dt[0], dt[-1])
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def renderPlot(fig, axes, title, dpi):
+    '''Add the legend to a plot and render it for the light and the dark color scheme
+
+    :param fig: The figure
+    :type fig: matplotlib.figure.Figure
+    :param axes: The axes of the figure
+    :type axes: list
+    :param title: The title of the figure
+    :type title: matplotlib.text.Text
+    :param dpi: The resolution of the png
+    :type dpi: integer
+
+    :returns: The png, light svg and dark svg data
+    :rtype: tuple
+    '''
+    #Setup
+    l = fig.legend(loc='upper center', bbox_to_anchor=__legendLoc__, ncol=6, edgecolor=__colorLight__)
+    l.get_frame().set_alpha(None)
+    l.get_frame().set_facecolor((0, 0, 0, 0))
+    setPlotColor(axes, title, l, __colorLight__)
+    fig.tight_layout(rect=__figRect__)
     png = io.BytesIO()
     svgLight = io.BytesIO()
-    svgDark = io.BytesIO()
     #Generate png
-    plt.savefig(png, format="png", dpi=figDPI)
+    fig.savefig(png, format="png", dpi=dpi)
     #Generate light svg
-    plt.savefig(svgLight, format="svg", dpi=figDPI, transparent=True)
-    #Generate dark svg
-    ax1.tick_params(which="both", colors=colorDark, labelcolor=colorDark)
-    ax2.tick_params(which="both", colors=colorDark, labelcolor=colorDark)
-    for spine in ax1.spines.values():
-        spine.set_edgecolor(colorDark)
-    for spine in ax2.spines.values():
-        spine.set_edgecolor(colorDark)
-    ax1.xaxis.label.set_color(colorDark)
-    ax1.yaxis.label.set_color(colorDark)
-    ax2.yaxis.label.set_color(colorDark)
-    t.set_color(colorDark)
-    l.get_frame().set_edgecolor(colorDark)
-    for text in l.get_texts():
-        text.set_color(colorDark)
-    plt.savefig(svgDark, format="svg", dpi=figDPI, transparent=True)
-    #Write to database
-    updateOrInsertPlot(db, "content", png, svgLight, svgDark)
+    fig.savefig(svgLight, format="svg", dpi=__figDPI__, transparent=True)
+    svgLight = svgLight.getvalue()
+    #Generate dark svg (the light color is only used for labels, ticks, spines, title and legend, so it can just be replaced)
+    svgDark = svgLight.replace(__colorLight__.encode(), __colorDark__.encode())
+    return png.getvalue(), svgLight, svgDark
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
-def updateOrInsertPlot(db, name, png, svgLight, svgDark):
+def setPlotColor(axes, title, legend, color):
+    '''Set the color of the labels, ticks, spines, title and legend of a plot
+
+    :param axes: The axes of the figure
+    :type axes: list
+    :param title: The title of the figure
+    :type title: matplotlib.text.Text
+    :param legend: The legend of the figure
+    :type legend: matplotlib.legend.Legend
+    :param color: The color
+    :type color: string
+    '''
+    for ax in axes:
+        ax.tick_params(which="both", colors=color, labelcolor=color)
+        for spine in ax.spines.values():
+            spine.set_edgecolor(color)
+        ax.xaxis.label.set_color(color)
+        ax.yaxis.label.set_color(color)
+    title.set_color(color)
+    legend.get_frame().set_edgecolor(color)
+    for text in legend.get_texts():
+        text.set_color(color)
+# ########################################################################### #
+
+# --------------------------------------------------------------------------- #
+def updateOrInsertPlot(db, name, png, svgLight, svgDark, dataHash=None):
     '''Update or insert a plot into the database
 
     :param db: Connection to the tube database
@@ -600,28 +579,22 @@ def updateOrInsertPlot(db, name, png, svgLight, svgDark):
     :param name: The name of the plot
     :type name: string
     :param png: The png data
-    :type png: binary
+    :type png: bytes
     :param svgLight: The svg data for a light color scheme
-    :type svgLight: binary
+    :type svgLight: bytes
     :param svgDark: The svg data for a dark color scheme
-    :type svgDark: binary
+    :type svgDark: bytes
+    :param dataHash: The hash of the data the plot was rendered from (Default: None)
+    :type dataHash: string, optional
 
     :raises: :class:``StatisticsError: An error occurred during the process
     '''
     timestamp = int(time.time())
     try:
-        png.seek(0)
-        svgLight.seek(0)
-        svgDark.seek(0)
-        db.execute("INSERT INTO statsPlots(name,timestamp,png,svgLight,svgDark) VALUES(?,?,?,?,?)", (name,timestamp,png.read(),svgLight.read(),svgDark.read()))
-    except sqlite3.Error:
-        try:
-            png.seek(0)
-            svgLight.seek(0)
-            svgDark.seek(0)
-            db.execute("UPDATE statsPlots SET timestamp=?,png=?,svgLight=?,svgDark=? WHERE name=?", (timestamp,png.read(),svgLight.read(),svgDark.read(),name))
-        except sqlite3.Error as e:
-            raise StatisticsError("Unable to save plot to database (Error: \"{}\")".format(e)) from e
+        cmd = "INSERT INTO statsPlots(name,timestamp,png,svgLight,svgDark,datahash) VALUES(?,?,?,?,?,?) ON CONFLICT(name) DO UPDATE SET timestamp=excluded.timestamp,png=excluded.png,svgLight=excluded.svgLight,svgDark=excluded.svgDark,datahash=excluded.datahash"
+        db.execute(cmd, (name, timestamp, png, svgLight, svgDark, dataHash))
+    except sqlite3.Error as e:
+        raise StatisticsError("Unable to save plot to database (Error: \"{}\")".format(e)) from e
 # ########################################################################### #
 
 # --------------------------------------------------------------------------- #
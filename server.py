@@ -5,11 +5,13 @@ import os
 import io
 import threading
 import locale
-import sqlite3
 import math
 import mimetypes
 import time
-from datetime import datetime, timezone
+import hashlib
+import collections
+import functools
+from datetime import datetime
 from pycountry import languages
 from PIL import Image
 import flask
@@ -19,6 +21,20 @@ from urlfinder import URLFinder
 
 __videosPerPage__ = 25
 __latestVideos__ = 4
+__imageCacheSize__ = 512
+__imageKeysTTL__ = 60 #Seconds (another process can re-index the database while serving)
+__imageMaxAge__ = 86400 #Seconds browsers may use an image without revalidating
+__timeUnits__ = ((31536000, "year", "years"), (2592000, "month", "months"), (604800, "week", "weeks"), (86400, "day", "days"), (3600, "hour", "hours"), (60, "minute", "minutes")) #Length in seconds, most significant first
+__videoListSQL__ = "SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? ORDER BY {} LIMIT ? OFFSET ?"
+__channelVideosSQL__ = {"new": __videoListSQL__.format("timestamp DESC"), "old": __videoListSQL__.format("timestamp ASC"), "view": __videoListSQL__.format("viewcount DESC")} #One fixed statement per sorting
+__channelCacheSize__ = 1024
+__channelCacheTTL__ = 60 #Seconds
+__pageCacheSize__ = 512
+__pageCacheTTL__ = 60 #Seconds (pages contain relative ages)
+__resample__ = getattr(Image, "Resampling", Image).BICUBIC #Image.Resampling only exists in Pillow >= 9.1
+__reducingGap__ = 2.0
+__smallThumbArgs__ = (400, None, None, 0.5625, "cc", None) #Thumbnail size used by the video lists
+__cropOffsets__ = {"tl": (0, 0), "tc": (0.5, 0), "tr": (1, 0), "cl": (0, 0.5), "cc": (0.5, 0.5), "cr": (1, 0.5), "bl": (0, 1), "bc": (0.5, 1), "br": (1, 1)} #Fraction of the excess width and height cut off at the left and top
 
 # =========================================================================== #
 class Server(threading.Thread):
@@ -27,32 +43,42 @@ class Server(threading.Thread):
     '''
 
     # --------------------------------------------------------------------------- #
-    def __init__(self, dbCon, baseinfo, listen, *args, **kw):
+    def __init__(self, pool, baseinfo, listen, threads=None, *args, **kw):
         '''
         Initialize the server
 
-        :param dbCon: Connection to the database
-        :type dbCon: sqlite3.Connection
+        :param pool: Pool of connections to the database
+        :type pool: atcommon.ConnectionPool
         :param baseinfo: A dict containing the name and the version
         :type baseinfo: dict
         :param listen: ip:port combination the server should listen on
         :type listen: string
+        :param threads: The number of threads serving requests (Default: number of CPUs)
+        :type threads: int, optional
         '''
         #Call superclass init
         super(Server, self).__init__(*args, **kw)
         self._listen = listen
+        self._threads = max(1, threads or os.cpu_count() or 1)
         #Set locale
         locale.setlocale(locale.LC_ALL, '')
         #Define url finder
         self._urlfinder = URLFinder()
         #Setup database
-        self._db = dbCon
-        self._db.row_factory = sqlite3.Row
+        self._pool = pool
+        #Cache of resized images by ETag and of the ETag and mime type by image and request arguments
+        self._imageCache = Cache(__imageCacheSize__)
+        self._imageKeys = Cache(4 * __imageCacheSize__, __imageKeysTTL__)
+        #Cache of channel info by id
+        self._channelCache = Cache(__channelCacheSize__, __channelCacheTTL__)
+        #Cache of rendered channel pages
+        self._pageCache = Cache(__pageCacheSize__, __pageCacheTTL__)
         #Base info dict
         self._baseinfo = baseinfo
-        r = self._db.execute("SELECT id,name FROM channels WHERE active = 1 ORDER BY name COLLATE NOCASE ASC")
-        data = r.fetchall()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,name FROM channels WHERE active = 1 ORDER BY name COLLATE NOCASE ASC")
+            data = r.fetchall()
+            del r
         channels = []
         for c in data:
             if c and c["name"]:
@@ -90,7 +116,7 @@ class Server(threading.Thread):
         '''
         urls = ["http://{}/".format(u) for u in self._listen.split()]
         print("Starting server at {}".format(", ".join(urls)))
-        waitress.serve(self._app, threads=os.cpu_count(), listen=self._listen)
+        waitress.serve(self._app, threads=self._threads, listen=self._listen)
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -99,9 +125,10 @@ class Server(threading.Thread):
         Return the landing page
         '''
         #Get channel info from database
-        r = self._db.execute("SELECT id,name,videos,lastupdate FROM channels WHERE active = 1 ORDER BY name COLLATE NOCASE ASC")
-        data = r.fetchall()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,name,videos,lastupdate FROM channels WHERE active = 1 ORDER BY name COLLATE NOCASE ASC")
+            data = r.fetchall()
+            del r
         channels = []
         for c in data:
             if c and c["name"]:
@@ -112,9 +139,10 @@ class Server(threading.Thread):
         if not channels:
             return self._getErrorPage(404, "No channel data in database")
         #Get general info from database
-        r = self._db.execute("SELECT lastupdate,channels,videos FROM info ORDER BY id DESC LIMIT 1;")
-        info = dict(r.fetchone())
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT lastupdate,channels,videos FROM info ORDER BY id DESC LIMIT 1;")
+            info = dict(r.fetchone())
+            del r
         info["agostring"] = self._timestampToHumanString(info["lastupdate"])
         info["lastupdate"] = self._timestampToLocalTimeString(info["lastupdate"])
         #Render template
@@ -133,19 +161,17 @@ class Server(threading.Thread):
             return flask.redirect(flask.url_for("home"))
 
         #Get video info from database
-        r = self._db.execute("SELECT id,channelID,title,timestamp,description,subtitles,filepath,tags,language,viewcount,statisticsupdated,likecount,dislikecount,chapters FROM videos WHERE id = ?", (videoID,))
-        video = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,channelID,title,timestamp,description,coalesce(subtitles, '') != '' AS subtitles,filepath,language,viewcount,statisticsupdated,likecount,dislikecount,coalesce(chapters, '') != '' AS chapters FROM videos WHERE id = ?", (videoID,))
+            video = r.fetchone()
+            del r
         if not video:
             return self._getErrorPage(404, "Video not found")
         video = dict(video)
-        #Get channel from database
-        r = self._db.execute("SELECT id,name,videos,lastupdate FROM channels WHERE id = ?", (video["channelID"],))
-        channel = r.fetchone()
-        del r
+        #Get channel info
+        channel = self._getChannelInfo(video["channelID"])
         if not channel:
             return self._getErrorPage(404, "Video channel not found")
-        channel = dict(channel)
         #Convert timestamp
         channel["lastupdate"] = self._timestampToHumanString(channel["lastupdate"])
         #Prepare statistics
@@ -168,9 +194,10 @@ class Server(threading.Thread):
             video["subtitles"] = False
             video["chapters"] = False
         #Get next video info from database
-        r = self._db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? AND timestamp > ? ORDER BY timestamp ASC LIMIT 1;", (channel["id"], video["timestamp"]))
-        nextVideo = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? AND timestamp > ? ORDER BY timestamp ASC LIMIT 1;", (channel["id"], video["timestamp"]))
+            nextVideo = r.fetchone()
+            del r
         if nextVideo:
             nextVideo = dict(nextVideo)
             #Convert timestamp
@@ -183,9 +210,10 @@ class Server(threading.Thread):
         else:
             nextVideo = None
         #Get previous video info from database
-        r = self._db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT 1;", (channel["id"], video["timestamp"]))
-        previousVideo = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT 1;", (channel["id"], video["timestamp"]))
+            previousVideo = r.fetchone()
+            del r
         if previousVideo:
             previousVideo = dict(previousVideo)
             #Convert timestamp
@@ -198,9 +226,10 @@ class Server(threading.Thread):
         else:
             previousVideo = None
         #Get latest video info from database
-        r = self._db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? ORDER BY timestamp DESC LIMIT 1", (channel["id"],))
-        latestVideo = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? ORDER BY timestamp DESC LIMIT 1", (channel["id"],))
+            latestVideo = r.fetchone()
+            del r
         if latestVideo:
             latestVideo = dict(latestVideo)
             #Convert timestamp
@@ -228,6 +257,35 @@ class Server(threading.Thread):
         return flask.render_template("watch.html", title=video["title"], video=video, nextVideo=nextVideo, previousVideo=previousVideo, latestVideo=latestVideo, channel=channel, base=self._baseinfo)
     # ########################################################################### #
 
+    # --------------------------------------------------------------------------- #
+    def _getChannelInfo(self, channelID):
+        '''
+        Return the info of a channel, cached for a short time
+
+        :param channelID: The channel ID
+        :type channelID: int or string
+
+        :returns: A copy of the channel info or None if the channel was not found
+        :rtype: dict
+        '''
+        key = str(channelID)
+        #Use the cached info if available
+        cached = self._channelCache.get(key)
+        if cached is not None:
+            return dict(cached)
+        #Otherwise get info from database
+        with self._pool.read() as db:
+            r = db.execute("SELECT id,name,description,location,joined,links,videos,lastupdate FROM channels WHERE id = ?", (channelID,))
+            data = r.fetchone()
+            del r
+        if not data:
+            return None
+        data = dict(data)
+        #Remember info
+        self._channelCache.set(key, data)
+        return dict(data)
+    # ########################################################################### #
+
     # --------------------------------------------------------------------------- #
     def _getChannel(self, channelID, func, page, sorting):
         '''
@@ -237,20 +295,47 @@ class Server(threading.Thread):
         if not channelID:
             return self._getErrorPage(404, "No channel ID specified")
 
-        #Get info from database
-        r = self._db.execute("SELECT id,name,description,location,joined,links,videos,lastupdate FROM channels WHERE id = ?", (channelID,))
-        data = r.fetchone()
-        del r
+        #Get channel info
+        data = self._getChannelInfo(channelID)
         if not data or not data["name"]:
             return self._getErrorPage(404, "Unable to find channel")
-        data = dict(data)
+        #Use the cached page if available (the last update invalidates it)
+        key = (str(channelID), func, page, sorting, data["lastupdate"])
+        html = self._pageCache.get(key)
+        if html is None:
+            html = self._renderChannel(data, channelID, func, page, sorting)
+            #Only remember rendered pages, not redirects
+            if isinstance(html, str):
+                self._pageCache.set(key, html)
+        return html
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def _renderChannel(self, data, channelID, func, page, sorting):
+        '''
+        Render a channel page
+
+        :param data: The channel info (gets modified)
+        :type data: dict
+        :param channelID: The channel ID
+        :type channelID: string
+        :param func: The channel tab ("home", "videos" or "info")
+        :type func: string
+        :param page: The page of the video list
+        :type page: int
+        :param sorting: The sorting of the video list ("new", "old" or "view")
+        :type sorting: string
+
+        :returns: The rendered page or a redirect to the channel home
+        :rtype: string or flask.Response
+        '''
         # Get channel home
         if func == "home":
             #Get 4 latest videos
-            cmd = "SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? ORDER BY timestamp DESC LIMIT {}".format(__latestVideos__)
-            r = self._db.execute(cmd, (channelID,))
-            videos = [dict(v) for v in r.fetchall()]
-            del r
+            with self._pool.read() as db:
+                r = db.execute(__channelVideosSQL__["new"], (channelID, __latestVideos__, 0))
+                videos = [dict(v) for v in r.fetchall()]
+                del r
             #Convert timestamp and duration
             for v in videos:
                 v["views"] = self._intToHuman(v["viewcount"])
@@ -277,17 +362,12 @@ class Server(threading.Thread):
             #Get sorting direction
             if sorting != "new":
                 data["sorting"] = sorting
-            if sorting == "old":
-                sorting = "timestamp ASC"
-            elif sorting == "view":
-                sorting = "viewcount DESC"
-            else:
-                sorting = "timestamp DESC"
-            #Query database
-            cmd = "SELECT id,title,timestamp,duration,resolution,viewcount,statisticsupdated FROM videos WHERE channelID = ? ORDER BY {} LIMIT {} OFFSET {}".format(sorting, __videosPerPage__, (page - 1)*__videosPerPage__)
-            r = self._db.execute(cmd, (channelID,))
-            videos = [dict(v) for v in r.fetchall()]
-            del r
+            cmd = __channelVideosSQL__.get(sorting, __channelVideosSQL__["new"])
+            #Query database (only values are bound, so each statement is prepared once per connection)
+            with self._pool.read() as db:
+                r = db.execute(cmd, (channelID, __videosPerPage__, (page - 1)*__videosPerPage__))
+                videos = [dict(v) for v in r.fetchall()]
+                del r
             #Convert timestamp and duration
             for v in videos:
                 v["views"] = self._intToHuman(v["viewcount"])
@@ -323,17 +403,19 @@ class Server(threading.Thread):
         Return the statistics page
         '''
         #Get last updated from database
-        r = self._db.execute("SELECT statisticsupdated FROM info WHERE id=1;")
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT statisticsupdated FROM info WHERE id=1;")
+            data = r.fetchone()
+            del r
         #If not found, no statistics were generated yet, return 404
         if not data or not data["statisticsupdated"]:
             return '', 404
         info = {"lastupdate": self._timestampToLocalTimeString(data["statisticsupdated"]), "agostring": self._timestampToHumanString(data["statisticsupdated"])}
         #Get latest stats from database
-        r = self._db.execute("SELECT * FROM statsOverall ORDER BY timestamp DESC LIMIT 1;")
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT * FROM statsOverall ORDER BY timestamp DESC LIMIT 1;")
+            data = r.fetchone()
+            del r
         #If not found, no statistics were generated yet, return 404
         if not data:
             return '', 404
@@ -346,37 +428,8 @@ class Server(threading.Thread):
         '''
         Return the video thumbnail
         '''
-        #If no id supplied, return 404
-        if not videoID:
-            return '', 404
-
-        #Get info from database
-        r = self._db.execute("SELECT thumb,thumbformat FROM videos WHERE id = ?", (videoID,))
-        data = r.fetchone()
-        del r
-        #If not found, return 404
-        if not data or not data["thumb"]:
-            return '', 404
-        #Try getting resize parameters
-        if flask.request.args:
-            try:
-                width = self._floatOrNone(flask.request.args.get("w"))
-                height = self._floatOrNone(flask.request.args.get("h"))
-                relWidth = self._floatOrNone(flask.request.args.get("rw"))
-                relHeight = self._floatOrNone(flask.request.args.get("rh"))
-                cropLoc = flask.request.args.get("c")
-                extra = flask.request.args.get("e")
-                img = self._manipulateImage(data["thumb"], data["thumbformat"], width, height, relWidth, relHeight, cropLoc, extra)
-            except ValueError:
-                img = data["thumb"]
-        else:
-            img = data["thumb"]
         #Respond with image
-        r = flask.make_response(img)
-        r.headers.set('Content-Type', data["thumbformat"])
-        r.cache_control.public = True
-        r.cache_control.max_age = 300
-        return r
+        return self._getImage("thumbs", "thumb", videoID)
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -384,37 +437,8 @@ class Server(threading.Thread):
         '''
         Return the profile picture of a channel
         '''
-        #If no id supplied, return 404
-        if not channelID:
-            return '', 404
-
-        #Get info from database
-        r = self._db.execute("SELECT profile,profileformat FROM channels WHERE id = ?", (channelID,))
-        data = r.fetchone()
-        del r
-        #If not found, return 404
-        if not data or not data["profile"]:
-            return '', 404
-        #Try getting resize parameters
-        if flask.request.args:
-            try:
-                width = self._floatOrNone(flask.request.args.get("w"))
-                height = self._floatOrNone(flask.request.args.get("h"))
-                relWidth = self._floatOrNone(flask.request.args.get("rw"))
-                relHeight = self._floatOrNone(flask.request.args.get("rh"))
-                cropLoc = flask.request.args.get("c")
-                extra = flask.request.args.get("e")
-                img = self._manipulateImage(data["profile"], data["profileformat"], width, height, relWidth, relHeight, cropLoc, extra)
-            except ValueError:
-                img = data["profile"]
-        else:
-            img = data["profile"]
         #Respond with image
-        r = flask.make_response(img)
-        r.headers.set('Content-Type', data["profileformat"])
-        r.cache_control.public = True
-        r.cache_control.max_age = 300
-        return r
+        return self._getImage("channelImages", "profile", channelID)
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -422,39 +446,8 @@ class Server(threading.Thread):
         '''
         Return the banner image of a channel
         '''
-        #If no id supplied, return 404
-        if not channelID:
-            return '', 404
-
-        #Get info from database
-        r = self._db.execute("SELECT banner,bannerformat FROM channels WHERE id = ?", (channelID,))
-        data = r.fetchone()
-        del r
-        #If not found, return 404
-        if not data or not data["banner"]:
-            return '', 404
-
-        #Try getting resize parameters
-        if flask.request.args:
-            try:
-                width = self._floatOrNone(flask.request.args.get("w"))
-                height = self._floatOrNone(flask.request.args.get("h"))
-                relWidth = self._floatOrNone(flask.request.args.get("rw"))
-                relHeight = self._floatOrNone(flask.request.args.get("rh"))
-                cropLoc = flask.request.args.get("c")
-                extra = flask.request.args.get("e")
-                img = self._manipulateImage(data["banner"], data["bannerformat"], width, height, relWidth, relHeight, cropLoc, extra)
-            except ValueError:
-                img = data["banner"]
-        else:
-            img = data["banner"]
-
         #Respond with image
-        r = flask.make_response(img)
-        r.headers.set('Content-Type', data["bannerformat"])
-        r.cache_control.public = True
-        r.cache_control.max_age = 300
-        return r
+        return self._getImage("channelImages", "banner", channelID)
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -487,9 +480,10 @@ class Server(threading.Thread):
 
         #Get plot from database
         cmd = "SELECT {} FROM statsPlots WHERE name = ?".format(field)
-        r = self._db.execute(cmd, (name,))
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute(cmd, (name,))
+            data = r.fetchone()
+            del r
         #If not found, return 404
         if not data or not data[field]:
             return '', 404
@@ -512,9 +506,10 @@ class Server(threading.Thread):
             return '', 404
 
         #Get info from database
-        r = self._db.execute("SELECT filepath FROM videos WHERE id = ?", (videoID,))
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT filepath FROM videos WHERE id = ?", (videoID,))
+            data = r.fetchone()
+            del r
         #If not found, return 404
         if not data or not data[0]:
             return '', 404
@@ -533,9 +528,10 @@ class Server(threading.Thread):
             return '', 404
 
         #Get info from database
-        r = self._db.execute("SELECT subtitles FROM videos WHERE id = ?", (videoID,))
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT subtitles FROM videos WHERE id = ?", (videoID,))
+            data = r.fetchone()
+            del r
         #If not found, return 404
         if not data or not data[0]:
             return '', 404
@@ -558,9 +554,10 @@ class Server(threading.Thread):
             return '', 404
 
         #Get info from database
-        r = self._db.execute("SELECT chapters FROM videos WHERE id = ?", (videoID,))
-        data = r.fetchone()
-        del r
+        with self._pool.read() as db:
+            r = db.execute("SELECT chapters FROM videos WHERE id = ?", (videoID,))
+            data = r.fetchone()
+            del r
         #If not found, return 404
         if not data or not data[0]:
             return '', 404
@@ -588,6 +585,122 @@ class Server(threading.Thread):
         return r
     # ########################################################################### #
 
+    # --------------------------------------------------------------------------- #
+    def _getImage(self, table, column, itemID):
+        '''
+        Return an image stored in a table
+
+        :param table: The table containing the image (thumbs or channelImages)
+        :type table: string
+        :param column: The column containing the image, the mime type is stored in column + "format"
+        :type column: string
+        :param itemID: The id of the row
+        :type itemID: string
+        '''
+        #If no id supplied, return 404
+        if not itemID:
+            return '', 404
+
+        #Answer requests for images that were served recently without reading them
+        key = (column, itemID, flask.request.query_string)
+        known = self._imageKeys.get(key)
+        if known is not None:
+            etag, imgFormat = known
+            if flask.request.if_none_match.contains(etag):
+                return self._setImageHeaders(flask.make_response('', 304), etag)
+            img = self._imageCache.get(etag)
+            if img is not None:
+                r = flask.make_response(img)
+                r.headers.set('Content-Type', imgFormat)
+                return self._setImageHeaders(r, etag)
+
+        #Check if the pre-rendered small thumbnail was requested
+        small = False
+        if column == "thumb" and flask.request.args:
+            small = self._getResizeArgs() == __smallThumbArgs__
+
+        #Get info from database
+        if small:
+            cmd = "SELECT coalesce(thumbsmall, thumb),thumbformat,thumbsmall IS NOT NULL FROM thumbs WHERE id = ?"
+        else:
+            cmd = "SELECT {0},{0}format FROM {1} WHERE id = ?".format(column, table)
+        with self._pool.read() as db:
+            r = db.execute(cmd, (itemID,))
+            data = r.fetchone()
+            del r
+        #If not found, return 404
+        if not data or not data[0]:
+            return '', 404
+        #Respond with image
+        return self._imageResponse(data[0], data[1], small and data[2], key)
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def _imageResponse(self, imgBin, imgFormat, resized=False, key=None):
+        '''
+        Return an image, resized according to the request arguments
+
+        The ETag is derived from the stored image and the request arguments,
+        so a revalidation can be answered without manipulating the image and
+        the resized images can be cached by their ETag
+
+        :param imgBin: The stored image
+        :type imgBin: binary
+        :param imgFormat: The mime type of the image
+        :type imgFormat: string
+        :param resized: Whether the image already has the requested size (Default: False)
+        :type resized: boolean, optional
+        :param key: Key under which the ETag and mime type are remembered (Default: None)
+        :type key: hashable, optional
+        '''
+        #Answer revalidations without sending or manipulating the image
+        h = hashlib.blake2b(imgBin, digest_size=16)
+        h.update(flask.request.query_string)
+        etag = h.hexdigest()
+        if key is not None:
+            self._imageKeys.set(key, (etag, imgFormat))
+        if flask.request.if_none_match.contains(etag):
+            r = flask.make_response('', 304)
+        else:
+            #Use the cached resized image if available
+            img = imgBin
+            cached = self._imageCache.get(etag)
+            if cached is not None:
+                img = cached
+            #Otherwise try getting resize parameters
+            elif flask.request.args and not resized:
+                try:
+                    img = self._manipulateImage(imgBin, imgFormat, *self._getResizeArgs())
+                except ValueError:
+                    pass
+                #Remember resized images
+                if img is not imgBin:
+                    self._imageCache.set(etag, img)
+            r = flask.make_response(img)
+            r.headers.set('Content-Type', imgFormat)
+        return self._setImageHeaders(r, etag)
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    @staticmethod
+    def _setImageHeaders(r, etag):
+        '''
+        Set the ETag and caching headers of an image response
+
+        :param r: The response
+        :type r: flask.Response
+        :param etag: The ETag of the image
+        :type etag: string
+
+        :returns: The response
+        :rtype: flask.Response
+        '''
+        r.set_etag(etag)
+        r.cache_control.public = True
+        r.cache_control.max_age = __imageMaxAge__
+        return r
+    # ########################################################################### #
+
     # --------------------------------------------------------------------------- #
     def _getError(self, error):
         '''
@@ -606,6 +719,22 @@ class Server(threading.Thread):
         return flask.render_template("error.html", error=description, base=self._baseinfo), code
     # ########################################################################### #
 
+    # --------------------------------------------------------------------------- #
+    @staticmethod
+    def renderSmallThumb(imgBin, imgFormat):
+        '''Render a thumbnail in the size used by the video lists
+
+        :param imgBin: The thumbnail
+        :type imgBin: binary
+        :param imgFormat: The mime type of the thumbnail
+        :type imgFormat: string
+
+        :returns: The small thumbnail in the same mime type
+        :rtype: binary
+        '''
+        return Server._manipulateImage(imgBin, imgFormat, *__smallThumbArgs__)
+    # ########################################################################### #
+
     # --------------------------------------------------------------------------- #
     @staticmethod
     def _manipulateImage(imgBin, imgFormat, width, height, relWidth, relHeight, cropLoc, extra):
@@ -631,7 +760,7 @@ class Server(threading.Thread):
         :returns: The manipulate image in the given mime type
         :rtype: binary
         '''
-        #Get image object
+        #Get image object (only reads the header, the image is decoded when it is first needed)
         img = Image.open(io.BytesIO(imgBin))
         #Get image size
         (iWidth, iHeight) = img.size
@@ -694,49 +823,40 @@ class Server(threading.Thread):
                     if dWidth > rWidth:
                         rWidth = dWidth
                         rHeight = rHeight / r
-                img = img.resize(tuple(int(i) for i in (rWidth, rHeight)))
+                img = img.resize(tuple(int(i) for i in (rWidth, rHeight)), resample=__resample__)
         #Check if the desired size is smaller than actual and no fixed size was given
         if dWidth < iWidth or dHeight < iHeight:
             if not (width and height):
                 if iWidth > iHeight:
                     rWidth = dWidth
                     rHeight = rWidth / iRel
-                    img = img.resize(tuple(int(i) for i in (rWidth, rHeight)))
                 else:
                     rHeight = dHeight
                     rWidth = rHeight * iRel
-                    img = img.resize(tuple(int(i) for i in (rWidth, rHeight)))
+                #Scale down to exactly the computed size (lets the JPEG decoder scale down while decoding and reduces
+                #the image by box filtering before resampling, as long as it stays at least twice the target size)
+                rSize = tuple(int(i) for i in (rWidth, rHeight))
+                if min(rSize) < 1:
+                    raise ValueError("Image can't be scaled down to {}x{}".format(*rSize))
+                img.draft(None, tuple(max(1, int(i * __reducingGap__)) for i in rSize))
+                img = img.resize(rSize, resample=__resample__, reducing_gap=__reducingGap__)
+        #Return the unchanged image if it already has the desired size
+        if (int(dWidth), int(dHeight)) == img.size == (iWidth, iHeight):
+            return imgBin
         #Get crop box
-        (iWidth, iHeight) = img.size
-        ch = iWidth - dWidth
-        h = ch / 2
-        cv = iHeight - dHeight
-        v = cv / 2
-        if cropLoc == "tl":
-            crop = (0, 0, dWidth, dHeight)
-        elif cropLoc == "tc":
-            crop = (h, 0, dWidth + h, dHeight)
-        elif cropLoc == "tr":
-            crop = (ch, 0, dWidth + ch, dHeight)
-        elif cropLoc == "cl":
-            crop = (0, v, dWidth, dHeight + v)
-        elif cropLoc == "cc":
-            crop = (h, v, dWidth + h, dHeight + v)
-        elif cropLoc == "cr":
-            crop = (ch, v, dWidth + ch, dHeight + v)
-        elif cropLoc == "bl":
-            crop = (0, cv, dWidth, dHeight + cv)
-        elif cropLoc == "bc":
-            crop = (h, cv, dWidth + h, dHeight + cv)
-        elif cropLoc == "br":
-            crop = (ch, cv, dWidth + ch, dHeight + cv)
-        else:
-            crop = None
-        #Crop image or scale it down
-        if crop:
-            img = img.crop(tuple(int(c) for c in crop))
-        else:
-            img = img.resize(tuple(int(i) for i in (dWidth, dHeight)))
+        offset = __cropOffsets__.get(cropLoc)
+        size = tuple(int(i) for i in (dWidth, dHeight))
+        #Crop image or scale it down (if it doesn't have the desired size already)
+        if img.size != size:
+            if offset:
+                (iWidth, iHeight) = img.size
+                left = (iWidth - dWidth) * offset[0]
+                top = (iHeight - dHeight) * offset[1]
+                img = img.crop(tuple(int(c) for c in (left, top, dWidth + left, dHeight + top)))
+            else:
+                if min(size) < 1:
+                    raise ValueError("Image can't be scaled down to {}x{}".format(*size))
+                img = img.resize(size, resample=__resample__, reducing_gap=__reducingGap__)
         #Return image
         f = imgFormat.split('/')[1].upper()
         stream = io.BytesIO()
@@ -746,17 +866,17 @@ class Server(threading.Thread):
 
     # --------------------------------------------------------------------------- #
     @staticmethod
-    def _floatOrNone(var):
-        '''Cast variable to float if not none
+    def _getResizeArgs():
+        '''Get the image manipulation parameters from the request arguments
+        (parsed once per request, invalid sizes are ignored)
 
-        :returns: Float value or None
-        :rtype: float or None
-
-        :raises: :class:``ValueError: Unable to cast
+        :returns: The width, height, relative width, relative height, crop location and extras
+        :rtype: tuple
         '''
-        if not var:
-            return None
-        return float(var)
+        if "resizeArgs" not in flask.g:
+            args = flask.request.args
+            flask.g.resizeArgs = (args.get("w", type=float), args.get("h", type=float), args.get("rw", type=float), args.get("rh", type=float), args.get("c"), args.get("e"))
+        return flask.g.resizeArgs
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -771,52 +891,19 @@ class Server(threading.Thread):
         :returns: Human readable time difference
         :rtype: string
         '''
-        #Get times
-        dt1 = int(timestamp)
-        dt2 = int(time.time())
-        #Get delta in minutes
-        delta = abs(dt2 - dt1)
-        #Get human string elements
-        humanElements = []
-        if delta >= 31536000: #A year
-            t = delta // 31536000
-            delta = delta % 31536000
-            s = "years" if t > 1 else "year"
-            humanElements.append("{} {}".format(t, s))
-        if delta >= 2592000: #A month
-            t = delta // 2592000
-            delta = delta % 2592000
-            s = "months" if t > 1 else "month"
-            humanElements.append("{} {}".format(t, s))
-        if delta >= 604800: #A week
-            t = delta // 604800
-            delta = delta % 604800
-            s = "weeks" if t > 1 else "week"
-            humanElements.append("{} {}".format(t, s))
-        if delta >= 86400: #A day
-            t = delta // 86400
-            delta = delta % 86400
-            s = "days" if t > 1 else "day"
-            humanElements.append("{} {}".format(t, s))
-        if delta >= 3600: #An hour
-            t = delta // 3600
-            delta = delta % 3600
-            s = "hours" if t > 1 else "hour"
-            humanElements.append("{} {}".format(t, s))
-        if delta >= 60: #A minute
-            t = delta // 60
-            delta = delta % 60
-            s = "minutes" if t > 1 else "minute"
-            humanElements.append("{} {}".format(t, s))
-        #Add remaining seconds
-        s = "seconds" if delta > 1 else "second"
-        humanElements.append("{} {}".format(delta, s))
-        #Return most significant
-        return humanElements[0]
+        #Get delta in seconds
+        delta = abs(int(time.time()) - int(timestamp))
+        #Return the most significant unit
+        for length, singular, plural in __timeUnits__:
+            if delta >= length:
+                t = delta // length
+                return "{} {}".format(t, plural if t > 1 else singular)
+        return "{} {}".format(delta, "seconds" if delta > 1 else "second")
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def _timestampToLocalTimeString(timestamp):
         '''Convert a UTC timestamp to local timestring
         :param timestamp: The timestamp
@@ -824,12 +911,10 @@ class Server(threading.Thread):
         :returns: Local time in the format YYYY-MM-DD HH:MM:SS
         :rtype: string
         '''
-        #Get datetime objects
+        #Get local time (fromtimestamp already converts to the local timezone)
         dt = datetime.fromtimestamp(timestamp)
-        #Change timezone
-        dt.replace(tzinfo=timezone.utc).astimezone(tz=None)
-        #Return time string
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
+        #Return time string (formatting the fields directly is faster than strftime)
+        return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
     # ########################################################################### #
 
     # --------------------------------------------------------------------------- #
@@ -912,3 +997,66 @@ class Server(threading.Thread):
     # ########################################################################### #
 
 # /////////////////////////////////////////////////////////////////////////// #
+
+# =========================================================================== #
+class Cache():
+    '''
+    Thread-safe least recently used cache with optional expiry
+    '''
+
+    # --------------------------------------------------------------------------- #
+    def __init__(self, maxsize, ttl=None):
+        '''
+        Initialize the cache
+
+        :param maxsize: The maximum number of entries
+        :type maxsize: int
+        :param ttl: The number of seconds after which entries expire (Default: never)
+        :type ttl: float, optional
+        '''
+        self._maxsize = maxsize
+        self._ttl = ttl
+        #Entries with expiry time (least recently used first)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def get(self, key):
+        '''
+        Return a cached value
+
+        :param key: The key of the entry
+        :type key: hashable
+
+        :returns: The value or None if not cached or expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def set(self, key, value):
+        '''
+        Cache a value, removing the least recently used entry if the cache is full
+
+        :param key: The key of the entry
+        :type key: hashable
+        :param value: The value
+        '''
+        expires = time.monotonic() + self._ttl if self._ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+    # ########################################################################### #
+
+# /////////////////////////////////////////////////////////////////////////// #
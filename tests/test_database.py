@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+''' Tests for the database upgrades '''
+
+import os
+import sys
+import sqlite3
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import atcommon as atc
+
+#Tables of a version 5 database that are changed by later upgrades (the statistics tables are left unchanged)
+__v5TablesSQL__ = """ CREATE TABLE info (
+                          id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+                          lastupdate INTEGER NOT NULL,
+                          channels INTEGER NOT NULL,
+                          videos INTEGER NOT NULL,
+                          dbversion INTEGER NOT NULL,
+                          statisticsupdated INTEGER
+                      );
+                      CREATE TABLE archives (
+                          id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+                          relpath TEXT NOT NULL,
+                          abspath TEXT NOT NULL,
+                          recursive BOOLEAN NOT NULL
+                      );
+                      CREATE TABLE channels (
+                          id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+                          relpath TEXT UNIQUE NOT NULL,
+                          abspath TEXT UNIQUE NOT NULL,
+                          name TEXT NOT NULL,
+                          url TEXT NOT NULL,
+                          language TEXT NOT NULL,
+                          description TEXT,
+                          location TEXT,
+                          joined TEXT,
+                          links TEXT,
+                          profile BLOB,
+                          profileformat TEXT,
+                          banner BLOB,
+                          bannerformat TEXT,
+                          videos INTEGER NOT NULL,
+                          lastupdate INTEGER NOT NULL,
+                          active INTEGER NOT NULL DEFAULT 0
+                      );
+                      CREATE TABLE videos (
+                          id TEXT PRIMARY KEY UNIQUE NOT NULL,
+                          channelID INTEGER NOT NULL,
+                          title TEXT NOT NULL,
+                          timestamp INTEGER NOT NULL,
+                          description TEXT,
+                          subtitles TEXT,
+                          filepath TEXT NOT NULL,
+                          thumb BLOB,
+                          thumbformat TEXT,
+                          duration INTEGER,
+                          tags TEXT,
+                          language TEXT NOT NULL,
+                          width INTEGER NOT NULL,
+                          height INTEGER NOT NULL,
+                          resolution TEXT NOT NULL,
+                          viewcount INTEGER,
+                          likecount INTEGER,
+                          dislikecount INTEGER,
+                          statisticsupdated INTEGER NOT NULL,
+                          active INTEGER NOT NULL DEFAULT 0,
+                          chapters TEXT
+                      );
+                      CREATE TABLE statsPlots (
+                          name TEXT PRIMARY KEY UNIQUE NOT NULL,
+                          timestamp INTEGER NOT NULL,
+                          png BLOB,
+                          svgLight BLOB,
+                          svgDark BLOB
+                      ); """
+
+# --------------------------------------------------------------------------- #
+def createV5DB():
+    '''Create an in-memory version 5 database with three channels and six videos
+
+    :returns: Connection to the database
+    :rtype: sqlite3.Connection
+    '''
+    dbCon = sqlite3.connect(":memory:")
+    dbCon.executescript(__v5TablesSQL__)
+    dbCon.execute("INSERT INTO info(lastupdate, channels, videos, dbversion) VALUES(?,?,?,?)", (1, 3, 6, 5))
+    cmd = "INSERT INTO channels(relpath, abspath, name, url, language, profile, profileformat, banner, bannerformat, videos, lastupdate, active) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"
+    dbCon.execute(cmd, ("a", "/a", "Alpha", "u", "en", b"profileA", "image/jpeg", b"bannerA", "image/png", 2, 1, 1))
+    dbCon.execute(cmd, ("b", "/b", "Beta", "u", "en", b"profileB", "image/jpeg", None, None, 2, 1, 1))
+    dbCon.execute(cmd, ("c", "/c", "Gamma", "u", "en", None, None, None, None, 2, 1, 0))
+    cmd = "INSERT INTO videos(id, channelID, title, timestamp, filepath, thumb, thumbformat, language, width, height, resolution, statisticsupdated, active) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)"
+    for i, (width, height) in enumerate(((3840, 2160), (1920, 1080), (1280, 720), (854, 480), (640, 360), (1080, 1920))):
+        thumb = "thumb{}".format(i).encode() if i != 3 else None
+        dbCon.execute(cmd, ("v{}".format(i), i // 2 + 1, "Video", i, "/v", thumb, "image/jpeg", "en", width, height, "{}x{}".format(width, height), 0, 1))
+    dbCon.execute("INSERT INTO statsPlots(name, timestamp, png) VALUES(?,?,?)", ("plot", 1, b"png"))
+    dbCon.commit()
+    return dbCon
+# ########################################################################### #
+
+# =========================================================================== #
+class TestUpgradeDB(unittest.TestCase):
+    '''
+    Test upgrading a version 5 database to the current version
+    '''
+
+    # --------------------------------------------------------------------------- #
+    def setUp(self):
+        '''
+        Create and upgrade the version 5 database
+        '''
+        self.dbCon = createV5DB()
+        self.assertTrue(atc.upgradeDB(self.dbCon))
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def tearDown(self):
+        '''
+        Close the database
+        '''
+        self.dbCon.close()
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def columns(self, table):
+        '''
+        Get the column names of a table (incl. generated columns)
+        '''
+        return [row[1] for row in self.dbCon.execute("PRAGMA table_xinfo({});".format(table))]
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testVersion(self):
+        '''
+        Check the database version and that a second upgrade does nothing
+        '''
+        self.assertEqual(self.dbCon.execute("SELECT dbversion FROM info;").fetchone()[0], atc.__dbversion__)
+        self.assertFalse(atc.upgradeDB(self.dbCon))
+        self.assertEqual(self.dbCon.execute("PRAGMA integrity_check;").fetchone()[0], "ok")
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testSchema(self):
+        '''
+        Check that the images moved to their own tables and the new columns exist
+        '''
+        self.assertEqual(self.columns("thumbs"), ["id", "thumb", "thumbformat", "thumbsmall"])
+        self.assertEqual(self.columns("channelImages"), ["id", "profile", "profileformat", "banner", "bannerformat"])
+        videoColumns = self.columns("videos")
+        self.assertIn("resclass", videoColumns)
+        self.assertNotIn("thumb", videoColumns)
+        self.assertNotIn("thumbformat", videoColumns)
+        for column in ("profile", "profileformat", "banner", "bannerformat"):
+            self.assertNotIn(column, self.columns("channels"))
+        self.assertIn("datahash", self.columns("statsPlots"))
+        indexes = {row[0] for row in self.dbCon.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL;")}
+        self.assertEqual(indexes, {"idxVideosChannel", "idxVideosStats", "idxVideosActive", "idxChannelsActive"})
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testRows(self):
+        '''
+        Check that no rows or images were lost
+        '''
+        for table, count in (("channels", 3), ("channelImages", 3), ("videos", 6), ("thumbs", 6), ("statsPlots", 1)):
+            self.assertEqual(self.dbCon.execute("SELECT count(*) FROM {};".format(table)).fetchone()[0], count, table)
+        thumbs = self.dbCon.execute("SELECT id, thumb, thumbsmall FROM thumbs ORDER BY id;").fetchall()
+        self.assertEqual(thumbs, [("v{}".format(i), "thumb{}".format(i).encode() if i != 3 else None, None) for i in range(6)])
+        images = self.dbCon.execute("SELECT id, profile, banner, bannerformat FROM channelImages ORDER BY id;").fetchall()
+        self.assertEqual(images, [(1, b"profileA", b"bannerA", "image/png"), (2, b"profileB", None, None), (3, None, None, None)])
+        resclass = [row[0] for row in self.dbCon.execute("SELECT resclass FROM videos ORDER BY id;")]
+        self.assertEqual(resclass, [4, 3, 2, 1, 0, 3])
+    # ########################################################################### #
+
+# /////////////////////////////////////////////////////////////////////////// #
+
+if __name__ == "__main__":
+    unittest.main()
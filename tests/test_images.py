@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+''' Tests for the image manipulation of the server '''
+
+import os
+import sys
+import io
+import unittest
+from PIL import Image
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server import Server
+import archivetube
+
+__color__ = (200, 120, 40)
+
+# --------------------------------------------------------------------------- #
+def createImage(width, height):
+    '''Create a single colored JPEG
+
+    :param width: The width of the image
+    :type width: int
+    :param height: The height of the image
+    :type height: int
+
+    :returns: The JPEG image
+    :rtype: binary
+    '''
+    stream = io.BytesIO()
+    Image.new("RGB", (width, height), __color__).save(stream, format="JPEG", quality=95)
+    return stream.getvalue()
+# ########################################################################### #
+
+# =========================================================================== #
+class TestManipulateImage(unittest.TestCase):
+    '''
+    Test the sizes and edges of the images requested by the templates
+    '''
+
+    # --------------------------------------------------------------------------- #
+    def assertImage(self, source, args, size):
+        '''
+        Manipulate an image and check its size and that its edges are not filled with black
+
+        :param source: The width and height of the source image
+        :type source: tuple
+        :param args: The width, height, relative width, relative height, crop location and extras
+        :type args: tuple
+        :param size: The expected size
+        :type size: tuple
+
+        :returns: The manipulated image
+        :rtype: PIL.Image.Image
+        '''
+        img = Image.open(io.BytesIO(Server._manipulateImage(createImage(*source), "image/jpeg", *args))).convert("RGB")
+        self.assertEqual(img.size, size)
+        (width, height) = img.size
+        for xy in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1), (width // 2, 0), (width // 2, height - 1), (0, height // 2), (width - 1, height // 2)):
+            pixel = img.getpixel(xy)
+            for c, e in zip(pixel, __color__):
+                self.assertLess(abs(c - e), 16, "Pixel {} is {}".format(xy, pixel))
+        return img
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testBanner(self):
+        '''
+        Banner on the channel page (w=2560, rh=0.1655, c=cc)
+        '''
+        self.assertImage((2560, 424), (2560, None, None, 0.1655, "cc", None), (2560, 423))
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testBannerMenu(self):
+        '''
+        Banner in the channel menu (h=150, rw=1/0.1655, c=cc)
+        '''
+        self.assertImage((2560, 424), (None, 150, 1/0.1655, None, "cc", None), (906, 150))
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testThumbnail(self):
+        '''
+        Thumbnails in the video lists (w=400, rh=0.5625, c=cc)
+        '''
+        self.assertImage((1280, 720), (400, None, None, 0.5625, "cc", None), (400, 225))
+        self.assertImage((1920, 1080), (400, None, None, 0.5625, "cc", None), (400, 225))
+        self.assertImage((1366, 768), (400, None, None, 0.5625, "cc", None), (400, 224))
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testPortraitThumbnail(self):
+        '''
+        Portrait thumbnails are scaled to the full height of the list thumbnail
+        '''
+        for source in ((720, 1280), (1080, 1920)):
+            img = Image.open(io.BytesIO(Server._manipulateImage(createImage(*source), "image/jpeg", 400, None, None, 0.5625, "cc", None)))
+            self.assertEqual(img.size, (400, 225))
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testProfile(self):
+        '''
+        Profile pictures (w=200 and w=60, rh=1, c=cc)
+        '''
+        self.assertImage((800, 800), (200, None, None, 1, "cc", None), (200, 200))
+        self.assertImage((800, 800), (60, None, None, 1, "cc", None), (60, 60))
+    # ########################################################################### #
+
+# /////////////////////////////////////////////////////////////////////////// #
+
+# =========================================================================== #
+class TestSmallThumb(unittest.TestCase):
+    '''
+    Test that the thumbnails pre-rendered during indexing match the ones rendered on request
+    '''
+
+    # --------------------------------------------------------------------------- #
+    def testMatchesRequest(self):
+        '''
+        Compare pre-rendered and requested thumbnails for sources with different aspect ratios
+        '''
+        for source in ((1280, 720), (1366, 768), (1440, 1080), (720, 1280), (1080, 1920)):
+            thumb = createImage(*source)
+            (small, videoID) = archivetube.renderSmallThumb(("id", thumb, "image/jpeg"))
+            self.assertEqual(videoID, "id")
+            requested = Server._manipulateImage(thumb, "image/jpeg", 400, None, None, 0.5625, "cc", None)
+            self.assertEqual(small, requested, "Source {}x{}".format(*source))
+            self.assertEqual(Image.open(io.BytesIO(small)).size[1], 225 if source != (1366, 768) else 224)
+    # ########################################################################### #
+
+    # --------------------------------------------------------------------------- #
+    def testUnreadable(self):
+        '''
+        Check that thumbnails that can't be rendered are stored as NULL
+        '''
+        self.assertEqual(archivetube.renderSmallThumb(("id", b"no image", "image/jpeg")), (None, "id"))
+        self.assertEqual(archivetube.renderSmallThumb(("id", createImage(1280, 720)[:200], "image/jpeg")), (None, "id"))
+        #Decompression bomb (more than twice the maximum number of pixels)
+        maxPixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 1000
+        try:
+            self.assertEqual(archivetube.renderSmallThumb(("id", createImage(1280, 720), "image/jpeg")), (None, "id"))
+        finally:
+            Image.MAX_IMAGE_PIXELS = maxPixels
+    # ########################################################################### #
+
+# /////////////////////////////////////////////////////////////////////////// #
+
+if __name__ == "__main__":
+    unittest.main()